@@ -2,18 +2,12 @@
 # License Apache-2.0 (http://www.apache.org/licenses/).
 
 import argparse
+import importlib
 import logging
 import sys
 
 from . import utils
-from .action import ActionEnvironment
-from .aggregate import AggregateEnvironment
-from .ci import CI, CIEnvironment
-from .env import Environment
-from .freeze import FreezeEnvironment
-from .migrate import MigrateEnvironment, load_migrate_arguments
-from .module import ModuleEnvironment
-from .run import RunEnvironment
+from .base import CI
 from .utils import config_logger
 
 LOG_LEVELS = {
@@ -25,6 +19,47 @@ LOG_LEVELS = {
     "off": None,
 }
 
+# Registry of the commands as mapping of the command names to the module and
+# class of the environment and the function running the command. The modules
+# are only imported if the command is used
+COMMANDS = {
+    ("c", "config"): ("env", "Environment", lambda e, c, a: print(e.config(a))),
+    ("g", "generate"): ("env", "Environment", lambda e, c, a: e.generate(a)),
+    ("f", "freeze"): ("freeze", "FreezeEnvironment", lambda e, c, a: e.freeze(a)),
+    ("i", "init"): ("aggregate", "AggregateEnvironment", lambda e, c, a: e.init(a)),
+    ("s", "shell"): ("run", "RunEnvironment", lambda e, c, a: e.shell(a)),
+    ("populate",): ("run", "RunEnvironment", lambda e, c, a: e.populate(a)),
+    ("r", "run"): ("run", "RunEnvironment", lambda e, c, a: e.start(a)),
+    ("t", "test"): ("ci", "CIEnvironment", lambda e, c, a: e.test(a)),
+    CI: ("ci", "CIEnvironment", lambda e, c, a: e.ci(c, a)),
+    ("u", "update"): ("module", "ModuleEnvironment", lambda e, c, a: e.update(a)),
+    ("a", "action"): (
+        "action",
+        "ActionEnvironment",
+        lambda e, c, a: e.apply_action(a),
+    ),
+    ("daemon",): ("daemon", "DaemonEnvironment", lambda e, c, a: e.daemon(a)),
+    ("show-all-prs", "show-closed-prs"): (
+        "aggregate",
+        "AggregateEnvironment",
+        lambda e, c, a: e.aggregate(c, a),
+    ),
+}
+
+
+# Commands which can be handled by a running daemon. Tests aren't forwarded
+# because the test modules and the HTTP server can't be loaded twice
+DAEMON_COMMANDS = ("a", "action", "s", "shell", "u", "update")
+
+
+def load_command(name):
+    """Return the environment class and the function of a command"""
+    for names, (module, cls, func) in COMMANDS.items():
+        if name in names:
+            module = importlib.import_module(f"{__package__ or 'doblib'}.{module}")
+            return getattr(module, cls), func
+    return None, None
+
 
 def load_arguments(args):
     """Parse the command line options"""
@@ -33,6 +68,7 @@ def load_arguments(args):
         "action",
         "c",
         "config",
+        "daemon",
         "f",
         "freeze",
         "g",
@@ -64,6 +100,8 @@ def load_arguments(args):
         help=f"Command to use. Possible choices: "
         f"a(ction): Execute pre-defined actions on the database\n"
         f"c(onfig): Output the aggregated configuration or parts of it\n"
+        f"daemon: Keep Odoo loaded and run action, shell and update "
+        f"commands of other dob processes\n"
         f"f(reeze): Freeze the packages and repositories\n"
         f"g(enerate): Generate the Odoo configuration. This is also part "
         f"of `init` and `update`\n"
@@ -87,6 +125,21 @@ def load_arguments(args):
         default=utils.get_config_file(),
         help="Configuration file to use. Default: %(default)s",
     )
+    base.add_argument(
+        "--each",
+        metavar="GLOB",
+        default=None,
+        help="Run the command for every configuration file matching the pattern "
+        "in its directory. Example: --each 'projects/*/odoo.project.yaml'",
+    )
+    base.add_argument(
+        "--each-jobs",
+        metavar="N",
+        type=int,
+        default=4,
+        help="Number of projects processed in parallel with --each. "
+        "Default: %(default)s",
+    )
     base.add_argument(
         "--logging",
         action="store",
@@ -97,10 +150,8 @@ def load_arguments(args):
     return parser.parse_known_args(args)
 
 
-# ruff: noqa: C901
-# pylint: disable=R0912
 def main(args=None):
-    args = args or sys.argv[1:]
+    args = raw_args = args or sys.argv[1:]
 
     # Don't parse the `help` on the first level if a command is given
     show_help = "-h" in args or "--help" in args
@@ -111,7 +162,8 @@ def main(args=None):
     if args.command in ("c", "config"):
         # Show the configuration of the environment (skip all non-ERROR logging)
         config_logger(logging.ERROR)
-        print(Environment(args.cfg).config(left))
+        env, func = load_command(args.command)
+        func(env(args.cfg), args.command, left)
         return
 
     if log_level:
@@ -119,44 +171,30 @@ def main(args=None):
 
     if show_help:
         left.append("--help")
+    elif args.each and args.command:
+        # Run the command for multiple projects
+        fleet = importlib.import_module(f"{__package__ or 'doblib'}.fleet")
+        sys.exit(
+            fleet.run_each(args.each, args.command, left, args.each_jobs, args.logging)
+        )
+        return
+    elif args.command in DAEMON_COMMANDS:
+        # Let a running daemon handle the command
+        daemon = importlib.import_module(f"{__package__ or 'doblib'}.daemon")
+        code = daemon.forward(raw_args, args.command, cfg=args.cfg)
+        if code is not None:
+            sys.exit(code)
+            return
 
-    if args.command in ("g", "generate"):
-        # Regenerate the configuration file
-        sys.exit(Environment(args.cfg).generate_config())
-    elif args.command in ("f", "freeze"):
-        # Freeze the environment
-        sys.exit(FreezeEnvironment(args.cfg).freeze(left))
-    elif args.command in ("i", "init"):
-        # Bootstrap the environment
-        sys.exit(AggregateEnvironment(args.cfg).init(left))
-    elif args.command in ("s", "shell"):
-        # Start a shell in the environment
-        sys.exit(RunEnvironment(args.cfg).shell(left))
-    elif args.command == "populate":
-        # Populate the database
-        sys.exit(RunEnvironment(args.cfg).populate(left))
-    elif args.command in ("r", "run"):
-        # Start the environment
-        sys.exit(RunEnvironment(args.cfg).start(left))
-    elif args.command in ("t", "test"):
-        # Run unit tests in the environment
-        sys.exit(CIEnvironment(args.cfg).test(left))
-    elif args.command in CI:
-        # Run tests on the environment
-        sys.exit(CIEnvironment(args.cfg).ci(args.command, left))
-    elif args.command in ("u", "update"):
-        # Update the modules of the environment
-        sys.exit(ModuleEnvironment(args.cfg).update(left))
-    elif args.command in ("a", "action"):
-        # Run actions in the environment
-        sys.exit(ActionEnvironment(args.cfg).apply_action(left))
+    env, func = load_command(args.command)
+    if env:
+        sys.exit(func(env(args.cfg), args.command, left))
     elif args.command in ("m", "migrate"):
         # Run Odoo migration using OpenUpgrade
-        migrate_args, left = load_migrate_arguments(left)
+        migrate = importlib.import_module(f"{__package__ or 'doblib'}.migrate")
+        migrate_args, left = migrate.load_migrate_arguments(left)
         migrate_cfg = f"odoo.migrate.{migrate_args.version[0]}.yaml"
-        sys.exit(MigrateEnvironment(migrate_cfg).migrate(migrate_args))
-    elif args.command in ("show-all-prs", "show-closed-prs"):
-        sys.exit(AggregateEnvironment(args.cfg).aggregate(args.command, left))
+        sys.exit(migrate.MigrateEnvironment(migrate_cfg).migrate(migrate_args))
     elif show_help:
         load_arguments(["--help"])
     else:
@@ -1,37 +1,77 @@
 # © 2021-2022 Florian Kantelberg (initOS GmbH)
 # License Apache-2.0 (http://www.apache.org/licenses/).
 
+import hashlib
+import json
 import os
-import sys
+import subprocess
 import threading
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from multiprocessing import cpu_count
-from queue import Empty, Queue
 
 from git_aggregator.config import get_repos
 from git_aggregator.main import match_dir
-from git_aggregator.repo import Repo
+from git_aggregator.repo import Repo, ishex
 from git_aggregator.utils import ThreadNameKeeper
 
-from . import env, utils
+from . import base, env, utils
+from .mirror import MirrorCache, git
 
+# File within the git directory of a repo storing the state of the last aggregation
+STATE_FILE = "dob-aggregate.json"
 
-def aggregate_repo(repo, args, sem, err_queue, mode=None):
-    """Aggregate one repo according to the args"""
-    try:
-        if not match_dir(repo.cwd, args.dirmatch):
-            return
 
-        if mode == "show-all-prs":
-            repo.show_all_prs()
-        elif mode == "show-closed-prs":
-            repo.show_closed_prs()
-        else:
-            repo.aggregate()
-    except Exception:
-        err_queue.put_nowait(sys.exc_info())
-    finally:
-        sem.release()
+def aggregate_repo(repo, args, mode=None):
+    """Aggregate one repo according to the args. Returns False if the repo
+    doesn't match the directory filter"""
+    if not match_dir(repo.cwd, args.dirmatch):
+        return False
+
+    if mode == "show-all-prs":
+        repo.show_all_prs()
+    elif mode == "show-closed-prs":
+        repo.show_closed_prs()
+    else:
+        repo.aggregate()
+    return True
+
+
+def repo_fingerprint(repo_dict):
+    """Return a checksum of the configuration of a repo"""
+    data = {key: val for key, val in repo_dict.items() if key != "force"}
+    data = json.dumps(data, sort_keys=True, default=sorted)
+    return hashlib.sha1(data.encode()).hexdigest()
+
+
+def resolve_merges(repo_dict):
+    """Resolve the refs of all merges to commit ids using one `git ls-remote` per
+    remote. Unresolvable refs are returned as None"""
+    urls = {remote["name"]: remote["url"] for remote in repo_dict["remotes"]}
+    refs = {}
+    for merge in repo_dict["merges"]:
+        refs.setdefault(merge["remote"], []).append(merge["ref"])
+
+    remote_refs = {}
+    for remote, names in refs.items():
+        output = git("ls-remote", urls[remote], *names)
+        for line in output.splitlines():
+            sha, ref = line.split()
+            remote_refs[remote, ref] = sha
+
+    result = []
+    for merge in repo_dict["merges"]:
+        remote, ref = merge["remote"], merge["ref"]
+        candidates = (ref, f"refs/heads/{ref}", f"refs/tags/{ref}")
+        sha = next(
+            (remote_refs[remote, x] for x in candidates if (remote, x) in remote_refs),
+            None,
+        )
+        if not sha and ishex(ref) and len(ref) == 40:
+            sha = ref
+        result.append(sha)
+    return result
 
 
 def load_init_arguments(args):
@@ -50,6 +90,12 @@ def load_init_arguments(args):
         default=False,
         help="Force the bootstrapping of repositories by stashing",
     )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        default=False,
+        help="Aggregate all repositories even if their merges didn't change",
+    )
     parser.add_argument(
         "-d",
         "--dirmatch",
@@ -100,52 +146,180 @@ def load_aggregate_arguments(args):
 class AggregateEnvironment(env.Environment):
     """Class to bootstrap the environment"""
 
-    def _aggregator(self, args, mode=None):
-        """Bootstrap the git repositories using git aggregator"""
+    def _durations_path(self):
+        return os.path.join(base.CACHE_PATH, "aggregate.json")
 
-        # Mostly adapted from the git aggregator main module with integration
-        # into the dob structure
-        jobs = max(args.jobs, 1)
-        threads = []
-        sem = threading.Semaphore(jobs)
-        err_queue = Queue()
+    def _schedule(self, repo_dicts, durations):
+        """Sort the repos by their previous duration with the longest first. Repos
+        without a recorded duration are scheduled first"""
+        return sorted(
+            repo_dicts,
+            key=lambda repo: -durations.get(repo["cwd"], float("inf")),
+        )
 
-        repos = self.get("repos", default={})
-        for repo_dict in get_repos(repos, args.force):
-            if not err_queue.empty():
-                break
-
-            with sem:
-                r = Repo(**repo_dict)
-                tname = os.path.basename(repo_dict["cwd"])
-
-                if jobs > 1:
-                    t = threading.Thread(
-                        target=aggregate_repo,
-                        args=(r, args, sem, err_queue, mode),
-                    )
-                    t.daemon = True
-                    t.name = tname
-                    threads.append(t)
-                    t.start()
+    def _repo_state(self, cwd):
+        """Return the state of the last aggregation of the repo"""
+        state = utils.read_json(os.path.join(cwd, ".git", STATE_FILE))
+        return state if isinstance(state, dict) else {}
+
+    def _store_repo_state(self, cwd, state):
+        utils.write_json(os.path.join(cwd, ".git", STATE_FILE), state)
+
+    def _check_repo(self, repo_dict):
+        """Return the state the repo would have after the aggregation and whether
+        the repo is unchanged since the last aggregation"""
+        state = {"config": repo_fingerprint(repo_dict)}
+        try:
+            state["inputs"] = resolve_merges(repo_dict)
+        except subprocess.CalledProcessError:
+            return state, False
+
+        cwd = repo_dict["cwd"]
+        stored = self._repo_state(cwd)
+        if (
+            None in state["inputs"]
+            or stored.get("config") != state["config"]
+            or stored.get("inputs") != state["inputs"]
+        ):
+            return state, False
+
+        try:
+            head = git("rev-parse", "HEAD", cwd=cwd).strip()
+        except subprocess.CalledProcessError:
+            return state, False
+        return state, head == stored.get("head")
+
+    def _changed_repos(self, repo_dicts, args):
+        """Filter the repos whose merges resolve to the same commits as during the
+        last aggregation and return the remaining ones with their new state"""
+        repo_dicts = [
+            repo_dict
+            for repo_dict in repo_dicts
+            if match_dir(repo_dict["cwd"], args.dirmatch)
+        ]
+
+        states = {}
+        with ThreadPoolExecutor(max_workers=max(args.jobs, 1)) as executor:
+            futures = {
+                repo_dict["cwd"]: executor.submit(self._check_repo, repo_dict)
+                for repo_dict in repo_dicts
+            }
+            for cwd, future in futures.items():
+                state, unchanged = future.result()
+                if unchanged and not args.full:
+                    utils.info(f"Skipping unchanged {cwd}")
                 else:
-                    with ThreadNameKeeper():
-                        threading.current_thread().name = tname
-                        aggregate_repo(r, args, sem, err_queue, mode)
+                    states[cwd] = state
+        return states
+
+    def _mirror_cache(self, repo_dicts, args, mode):
+        """Fetch the refs of all remotes into shared mirrors if a path for them is
+        configured"""
+        path = self.get(base.SECTION, "mirror_cache", default=None)
+        if mode is not None or str(path).lower() in ("", "none", "false", "0", "off"):
+            return None
+
+        # The mirrors can't live in the cache because the repos depend on them
+        if not isinstance(path, str) or utils.tobool(path):
+            utils.warn("bootstrap:mirror_cache must be the path of the mirrors")
+            return None
+
+        path = os.path.abspath(path)
+        if not os.path.isdir(path):
+            utils.warn(
+                f"Creating the mirrors in {path}. The repositories borrow objects "
+                "from them and break if it is deleted"
+            )
 
-        for t in threads:
-            t.join()
+        mirrors = MirrorCache(path)
+        for repo_dict in repo_dicts:
+            if match_dir(repo_dict["cwd"], args.dirmatch):
+                mirrors.collect(repo_dict)
+
+        utils.info(f"Updating {len(mirrors.refspecs)} mirrors")
+        mirrors.update(args.jobs)
+        return mirrors
+
+    def _aggregate_job(
+        self, repo_dict, args, mode, cancelled, mirrors=None, state=None
+    ):
+        """Aggregate a single repo within a worker thread. The state is stored
+        after a successful aggregation"""
+        if cancelled.is_set():
+            return None
+
+        with ThreadNameKeeper():
+            threading.current_thread().name = os.path.basename(repo_dict["cwd"])
+            start = time.perf_counter()
+            try:
+                if mirrors and match_dir(repo_dict["cwd"], args.dirmatch):
+                    mirrors.link(repo_dict["cwd"])
+                if not aggregate_repo(Repo(**repo_dict), args, mode):
+                    return None
+                if state:
+                    state["head"] = git("rev-parse", "HEAD", cwd=repo_dict["cwd"])
+                    state["head"] = state["head"].strip()
+                    self._store_repo_state(repo_dict["cwd"], state)
+            except Exception:
+                # Fail fast by skipping all repos which didn't start yet
+                cancelled.set()
+                raise
+            return time.perf_counter() - start
+
+    def _aggregator(self, args, mode=None):
+        """Bootstrap the git repositories using git aggregator. The repos are
+        processed by a pool of workers with the longest running repos first and
+        the remaining repos are cancelled after the first failure"""
+        path = self._durations_path()
+        durations = utils.read_json(path, default={})
+        if not isinstance(durations, dict):
+            durations = {}
+
+        repos = self.get("repos", default={})
+        repo_dicts = self._schedule(get_repos(repos, args.force), durations)
+
+        states = {}
+        if mode is None:
+            states = self._changed_repos(repo_dicts, args)
+            repo_dicts = [repo for repo in repo_dicts if repo["cwd"] in states]
+
+        mirrors = self._mirror_cache(repo_dicts, args, mode)
+
+        failed = False
+        cancelled = threading.Event()
+        with ThreadPoolExecutor(max_workers=max(args.jobs, 1)) as executor:
+            futures = {
+                executor.submit(
+                    self._aggregate_job,
+                    *(repo_dict, args, mode, cancelled, mirrors),
+                    states.get(repo_dict["cwd"]),
+                ): repo_dict["cwd"]
+                for repo_dict in repo_dicts
+            }
+
+            for future in as_completed(futures):
+                cwd = futures[future]
+                if future.cancelled():
+                    continue
 
-        if not err_queue.empty():
-            while True:
                 try:
-                    exc_type, exc_obj, exc_trace = err_queue.get_nowait()
-                except Empty:
-                    break
-                traceback.print_exception(exc_type, exc_obj, exc_trace)
-            return 1
+                    duration = future.result()
+                except Exception:
+                    traceback.print_exc()
+                    utils.error(f"Aggregation of {cwd} failed")
+                    failed = True
+                    for pending in futures:
+                        pending.cancel()
+                    continue
+
+                if duration is not None:
+                    utils.info(f"Aggregated {cwd} in {duration:.1f}s")
+                    if mode is None:
+                        durations[cwd] = round(duration, 3)
 
-        return 0
+        if mode is None:
+            utils.write_json(path, durations)
+        return 1 if failed else 0
 
     def init(self, args=None):
         """Initialize the environment using the git-aggregator"""
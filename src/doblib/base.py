@@ -7,8 +7,12 @@ ODOO_CONFIG = os.path.abspath(
     os.path.join("etc", os.environ.get("ODOO_CONFIG", "odoo.cfg"))
 )
 ADDON_PATH = "/tmp/addons"
+# Directory for the persistent caches and indexes of dob
+CACHE_PATH = os.path.abspath(os.environ.get("DOB_CACHE", ".dob"))
 
 SECTION = "bootstrap"
+# Supported CI tools
+CI = ("black", "eslint", "flake8", "isort", "prettier", "pylint", "ruff", "ruff-format")
 # Mapping of environment variables to configurations
 ENVIRONMENT = {
     "ODOO_VERSION": ("odoo", "version"),
@@ -19,3 +23,7 @@ ENVIRONMENT = {
 
 class DuplicateModule(Exception):
     pass
+
+
+class SubstitutionCycle(Exception):
+    pass
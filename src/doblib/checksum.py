@@ -0,0 +1,149 @@
+# © 2026 initOS GmbH
+# License Apache-2.0 (http://www.apache.org/licenses/).
+
+import hashlib
+import os
+from fnmatch import fnmatch
+
+from . import base, utils
+
+# Table storing the module checksums of the last update within each database
+TABLE = "dob_module_checksum"
+
+# Patterns of files which don't influence the state of a module in the database.
+# These are the same defaults as used by `module_auto_update`
+EXCLUDE_PATTERNS = (
+    "*.pyc",
+    "*.pyo",
+    "i18n/*.pot",
+    "i18n_extra/*.pot",
+    "static/*",
+    "tests/*",
+)
+
+
+def file_hash(path):
+    """Return the sha1 hash of the content of a file"""
+    h = hashlib.sha1()
+    with open(path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def read_checksums(cr):
+    """Read the module checksums of the last update from the database. Returns
+    None if the database doesn't have any"""
+    cr.execute("SELECT to_regclass(%s)", (TABLE,))
+    if not cr.fetchone()[0]:
+        return None
+
+    cr.execute(f"SELECT module, checksum FROM {TABLE}")
+    return dict(cr.fetchall())
+
+
+def store_checksums(cr, checksums):
+    """Replace the module checksums stored in the database"""
+    cr.execute(
+        f"CREATE TABLE IF NOT EXISTS {TABLE} "
+        "(module VARCHAR PRIMARY KEY, checksum VARCHAR NOT NULL)"
+    )
+    cr.execute(f"DELETE FROM {TABLE}")
+    for name, checksum in sorted(checksums.items()):
+        cr.execute(
+            f"INSERT INTO {TABLE} (module, checksum) VALUES (%s, %s)",
+            (name, checksum),
+        )
+
+
+def changed_modules(stored, checksums):
+    """Return the modules with a different checksum than stored or None if
+    nothing is stored"""
+    if stored is None:
+        return None
+
+    return {
+        name for name, checksum in checksums.items() if stored.get(name) != checksum
+    }
+
+
+class ChecksumIndex:
+    """Persistent index of module checksums. The hash of each file is cached
+    using the mtime and size of the file to prevent rehashing of unchanged files"""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(base.CACHE_PATH, "checksums.json")
+        self.files = {}
+        self._seen = set()
+        self.load()
+
+    def load(self):
+        """Load the index from the file"""
+        data = utils.read_json(self.path)
+        if isinstance(data, dict):
+            self.files = data.get("files") or {}
+
+    def save(self):
+        """Write the index back to the file dropping files which weren't seen"""
+        if self._seen:
+            self.files = {k: v for k, v in self.files.items() if k in self._seen}
+
+        with utils.file_lock(self.path):
+            utils.write_json(self.path, {"files": self.files})
+
+    def _hash(self, path):
+        """Return the hash of a file and only rehash if mtime or size changed"""
+        stat = os.stat(path)
+        cached = self.files.get(path)
+        self._seen.add(path)
+        if cached and cached[:2] == [stat.st_mtime_ns, stat.st_size]:
+            return cached[2]
+
+        digest = file_hash(path)
+        self.files[path] = [stat.st_mtime_ns, stat.st_size, digest]
+        return digest
+
+    def module_checksum(self, path):
+        """Calculate the checksum of a module folder"""
+        path = os.path.realpath(path)
+        h = hashlib.sha1()
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                rel_path = os.path.relpath(file_path, path)
+                if name.startswith(".") or any(
+                    fnmatch(rel_path, pat) for pat in EXCLUDE_PATTERNS
+                ):
+                    continue
+
+                h.update(rel_path.encode())
+                h.update(b"\0")
+                h.update(self._hash(file_path).encode())
+                h.update(b"\0")
+        return h.hexdigest()
+
+    def translation_checksum(self, path):
+        """Calculate the checksum of the PO files of a module"""
+        path = os.path.realpath(path)
+        h = hashlib.sha1()
+        for folder in ("i18n", "i18n_extra"):
+            try:
+                files = sorted(os.listdir(os.path.join(path, folder)))
+            except OSError:
+                continue
+
+            for name in files:
+                file_path = os.path.join(path, folder, name)
+                if name.endswith(".po") and os.path.isfile(file_path):
+                    h.update(f"{folder}/{name}".encode())
+                    h.update(b"\0")
+                    h.update(self._hash(file_path).encode())
+                    h.update(b"\0")
+        return h.hexdigest()
+
+    def checksums(self, modules):
+        """Calculate the checksums of the modules given as mapping to the path"""
+        return {
+            name: self.module_checksum(path) for name, path in sorted(modules.items())
+        }
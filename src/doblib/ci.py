@@ -12,7 +12,7 @@ import pytest
 
 from . import base, env, utils
 
-CI = ("black", "eslint", "flake8", "isort", "prettier", "pylint", "ruff", "ruff-format")
+CI = base.CI
 
 
 def load_ci_arguments(args):
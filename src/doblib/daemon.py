@@ -0,0 +1,238 @@
+# © 2026 initOS GmbH
+# License Apache-2.0 (http://www.apache.org/licenses/).
+
+import io
+import json
+import os
+import socket
+import sys
+import traceback
+from contextlib import closing
+
+from . import base, env, utils
+from .checksum import ChecksumIndex
+
+
+def socket_path():
+    """Return the default path of the daemon socket"""
+    return os.path.join(base.CACHE_PATH, "daemon.sock")
+
+
+def load_daemon_arguments(args):
+    parser = utils.default_parser("daemon")
+    parser.add_argument(
+        "--socket",
+        default=None,
+        help="Path of the Unix socket. Default: daemon.sock in the cache directory",
+    )
+    return parser.parse_known_args(args)
+
+
+def send(conn, message):
+    """Send a message as JSON line"""
+    conn.sendall(json.dumps(message).encode() + b"\n")
+
+
+class StreamWriter(io.TextIOBase):
+    """Text stream sending everything written as messages to the client"""
+
+    def __init__(self, conn, kind):
+        super().__init__()
+        self.conn = conn
+        self.kind = kind
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        if text:
+            send(self.conn, {self.kind: text})
+        return len(text)
+
+
+def forward(args, command, path=None, cfg=None):
+    """Run the command within a running daemon and stream the output back. Returns
+    the exit code or None if no daemon can handle the command"""
+    path = path or socket_path()
+    if utils.tobool(os.environ.get("DOB_NO_DAEMON")) or not os.path.exists(path):
+        return None
+
+    # Interactive shells need a terminal
+    stdin = command in ("s", "shell")
+    if stdin and sys.stdin.isatty():
+        return None
+
+    try:
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.connect(path)
+    except OSError:
+        return None
+
+    with closing(conn):
+        request = {
+            "args": args,
+            "cwd": os.getcwd(),
+            "config": os.path.abspath(cfg) if cfg else None,
+            "environment": env.config_environment(),
+            "stdin": stdin,
+        }
+        send(conn, request)
+
+        with conn.makefile("r", encoding="utf-8") as fp:
+            for line in fp:
+                message = json.loads(line)
+                if "accept" in message:
+                    # Only consume the input once the daemon runs the command
+                    if stdin:
+                        send(conn, {"stdin": sys.stdin.read()})
+                elif "out" in message:
+                    sys.stdout.write(message["out"])
+                    sys.stdout.flush()
+                elif "err" in message:
+                    sys.stderr.write(message["err"])
+                    sys.stderr.flush()
+                elif "exit" in message:
+                    return message["exit"]
+                elif "stale" in message:
+                    utils.info(f"Daemon not used: {message['stale']}")
+                    return None
+    return None
+
+
+class DaemonEnvironment(env.Environment):
+    """Environment keeping Odoo and the registry loaded to serve commands"""
+
+    def _module_checksums(self):
+        """Return the checksums of all available modules"""
+        index = ChecksumIndex(os.path.join(base.CACHE_PATH, "daemon.json"))
+        checksums = index.checksums(self._get_module_paths())
+        index.save()
+        return checksums
+
+    def _outdated(self, checksums):
+        """Return the reason why the loaded state is outdated or None"""
+        for path, cached in self._files.items():
+            state = self._file_state(path, cached)
+            if (state and state[2]) != (cached and cached[2]):
+                return f"{path} changed"
+
+        if self._module_checksums() != checksums:
+            return "Modules changed"
+        return None
+
+    def _preload(self):
+        """Load the Odoo configuration and the registry of the database"""
+        # pylint: disable=C0415,E0401
+        from odoo.tools import config
+
+        config.parse_config(["-c", base.ODOO_CONFIG])
+        db_name = self._db_name()
+        if not db_name:
+            return
+
+        try:
+            with self.env(db_name, rollback=True):
+                utils.info(f"Loaded registry of {db_name}")
+        except Exception as e:
+            utils.warn(f"Unable to load the registry of {db_name}: {e}")
+
+    def _run(self, conn, request, stdin=None):
+        """Run the requested command while sending the output to the client"""
+        # pylint: disable=C0415
+        from .__main__ import main
+
+        streams = sys.stdin, sys.stdout, sys.stderr, sys.argv
+        sys.stdin = io.StringIO(stdin or "")
+        sys.stdout = StreamWriter(conn, "out")
+        sys.stderr = StreamWriter(conn, "err")
+        try:
+            main(request["args"])
+            code = 0
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else int(e.code is not None)
+        except Exception:
+            traceback.print_exc()
+            code = 1
+        finally:
+            sys.stdin, sys.stdout, sys.stderr, sys.argv = streams
+
+        send(conn, {"exit": code})
+
+    def _handle(self, conn, checksums):
+        """Handle a request and return the reason if the daemon must restart"""
+        with conn.makefile("r", encoding="utf-8") as fp:
+            return self._handle_request(conn, fp, checksums)
+
+    def _handle_request(self, conn, fp, checksums):
+        request = json.loads(fp.readline() or "{}")
+
+        if request.get("cwd") != os.getcwd():
+            send(conn, {"stale": "Different working directory"})
+            return None
+
+        # Odoo and its configuration were loaded for the configuration file
+        if request.get("config") != os.path.abspath(self._cfg):
+            send(conn, {"stale": "Different configuration file"})
+            return None
+
+        if request.get("environment") != env.config_environment():
+            send(conn, {"stale": "Different environment variables"})
+            return None
+
+        reason = self._outdated(checksums)
+        if reason:
+            send(conn, {"stale": reason})
+            return reason
+
+        # The client sends the input only after the request was accepted
+        send(conn, {"accept": True})
+        stdin = None
+        if request.get("stdin"):
+            stdin = json.loads(fp.readline() or "{}").get("stdin")
+
+        self._run(conn, request, stdin)
+        return None
+
+    def serve(self, path):
+        """Serve requests on the socket until the loaded state is outdated"""
+        checksums = self._module_checksums()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            os.unlink(path)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            server.bind(path)
+            os.chmod(path, 0o600)
+            server.listen()
+            utils.info(f"Listening on {path}")
+            while True:
+                conn, _ = server.accept()
+                with closing(conn):
+                    reason = self._handle(conn, checksums)
+                if reason:
+                    return reason
+        finally:
+            server.close()
+            if os.path.exists(path):
+                os.unlink(path)
+
+    def daemon(self, args=None):
+        """Keep Odoo loaded and run the commands of clients"""
+        args, _ = load_daemon_arguments(args or [])
+        if not self._init_odoo():
+            return 1
+
+        # Commands run within the daemon must not forward to it again
+        os.environ["DOB_NO_DAEMON"] = "1"
+        self._preload()
+
+        try:
+            reason = self.serve(args.socket or socket_path())
+        except KeyboardInterrupt:
+            return 0
+
+        # Restart with a fresh interpreter to drop all loaded modules
+        utils.info(f"Restarting the daemon: {reason}")
+        os.execv(sys.executable, [sys.executable, "-m", "doblib", *sys.argv[1:]])
+        return 0
@@ -2,17 +2,30 @@
 # License Apache-2.0 (http://www.apache.org/licenses/).
 
 import configparser
+import hashlib
+import io
 import os
+import pickle
 import re
 import shutil
 import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import closing, contextmanager
 
 import yaml
 
 from . import base, utils
+from .manifest import ManifestIndex
 
 SubstituteRegex = re.compile(r"\$\{(?P<var>(\w|:)+)\}")
+# Use the faster libyaml based loader if available
+YamlLoader = getattr(yaml, "CFullLoader", yaml.FullLoader)
+# Increase if the format of the cached configuration changes
+CONFIG_CACHE_VERSION = 2
+# Minimal and maximal memory per worker used by the autotuning
+AUTOTUNE_WORKER_MEMORY = 640 << 20
+AUTOTUNE_MEMORY_HARD = 2560 << 20
 
 
 def load_config_arguments(args):
@@ -26,16 +39,115 @@ def load_config_arguments(args):
     return parser.parse_known_args(args)
 
 
+def config_environment():
+    """Return the environment variables influencing the configuration"""
+    prefixes = ("ODOO_", "BOOTSTRAP_", *base.ENVIRONMENT)
+    return {k: v for k, v in os.environ.items() if k.startswith(prefixes)}
+
+
+def load_generate_arguments(args):
+    parser = utils.default_parser("generate")
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        default=False,
+        help="Only check if the configuration file is up to date",
+    )
+    return parser.parse_known_args(args)
+
+
 # pylint: disable=too-many-public-methods
 class Environment:
     """Bootstrap environment"""
 
     def __init__(self, cfg):
         utils.info("Loading configuration file")
+        self._cfg = cfg
         self._config = {}
+        self._files = {}
+        self._resolved, self._resolving = {}, []
+        if self._load_cached_config():
+            return
+
         self._load_config(cfg)
         self._load_config("odoo.versions.yaml", False)
         self._post_process_config()
+        self._save_cached_config()
+
+    def _config_cache_path(self):
+        """Return the path of the cached configuration"""
+        key = os.path.join(os.getcwd(), self._cfg).encode()
+        return os.path.join(
+            base.CACHE_PATH, f"config-{hashlib.sha1(key).hexdigest()[:16]}.pickle"
+        )
+
+    def _file_state(self, path, cached=None):
+        """Return the mtime, size and hash of a file or None if missing. The file
+        is only hashed again if the mtime or size changed"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        if cached and cached[:2] == [stat.st_mtime_ns, stat.st_size]:
+            return cached
+
+        with open(path, "rb") as fp:
+            digest = hashlib.sha1(fp.read()).hexdigest()
+        return [stat.st_mtime_ns, stat.st_size, digest]
+
+    def _load_cached_config(self):
+        """Load the processed configuration from the cache if none of the included
+        files and environment variables changed"""
+        if not utils.tobool(os.environ.get("DOB_CONFIG_CACHE", True)):
+            return False
+
+        try:
+            with open(self._config_cache_path(), "rb") as fp:
+                data = pickle.load(fp)
+        except Exception:
+            return False
+
+        if (
+            not isinstance(data, dict)
+            or data.get("version") != CONFIG_CACHE_VERSION
+            or data.get("environment") != config_environment()
+        ):
+            return False
+
+        files = {}
+        for path, cached in data["files"].items():
+            state = self._file_state(path, cached)
+            if (state and state[2]) != (cached and cached[2]):
+                return False
+            files[path] = state
+
+        utils.info(" * cached")
+        self._config, self._files = data["config"], files
+        if files != data["files"]:
+            self._save_cached_config()
+        return True
+
+    def _save_cached_config(self):
+        """Store the processed configuration in the cache"""
+        if not utils.tobool(os.environ.get("DOB_CONFIG_CACHE", True)):
+            return
+
+        data = {
+            "version": CONFIG_CACHE_VERSION,
+            "environment": config_environment(),
+            "files": self._files,
+            "config": self._config,
+        }
+        path = self._config_cache_path()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as fp:
+                pickle.dump(data, fp)
+            os.replace(tmp, path)
+        except (OSError, pickle.PicklingError, TypeError):
+            utils.warn("Unable to cache the configuration")
 
     def _substitute(self, match, sub=True):
         """Replaces the matched parts with the variable"""
@@ -43,9 +155,39 @@ class Environment:
         if not all(var):
             raise SyntaxError()
 
-        result = self.get(*var)
+        result = self._resolve(tuple(var))
         return str(result) if sub else result
 
+    def _resolve(self, key):
+        """Return the substituted value of a configuration key. Referenced values
+        are resolved first and each value is only substituted once"""
+        if key in self._resolved:
+            return self._resolved[key]
+
+        if key in self._resolving:
+            cycle = self._resolving[self._resolving.index(key) :] + [key]
+            cycle = " -> ".join(":".join(map(str, k)) or "<root>" for k in cycle)
+            raise base.SubstitutionCycle(f"Cyclic substitution {cycle}")
+
+        self._resolving.append(key)
+        try:
+            value = self._substitute_value(key, self.get(*key))
+        finally:
+            self._resolving.pop()
+
+        self._resolved[key] = value
+        return value
+
+    def _substitute_value(self, key, value):
+        """Substitute variables in strings, lists and dictionaries"""
+        if isinstance(value, str):
+            return self._substitute_string(value)
+        if isinstance(value, list):
+            return [self._resolve((*key, i)) for i in range(len(value))]
+        if isinstance(value, dict):
+            return {k: self._resolve((*key, k)) for k in value}
+        return value
+
     def _substitute_string(self, line):
         """Substitute variables in strings"""
         match = SubstituteRegex.fullmatch(line)
@@ -53,34 +195,6 @@ class Environment:
             return self._substitute(match, False)
         return SubstituteRegex.sub(self._substitute, line)
 
-    def _substitute_dict(self, data):
-        """Substitute variables in dictionaries"""
-        tmp = {}
-        for sec, section in data.items():
-            if isinstance(section, str):
-                tmp[sec] = self._substitute_string(section)
-            elif isinstance(section, list):
-                tmp[sec] = self._substitute_list(section)
-            elif isinstance(section, dict):
-                tmp[sec] = self._substitute_dict(section)
-            else:
-                tmp[sec] = section
-        return tmp
-
-    def _substitute_list(self, ls):
-        """Substitute variables in lists"""
-        tmp = []
-        for x in ls:
-            if isinstance(x, dict):
-                tmp.append(self._substitute_dict(x))
-            elif isinstance(x, str):
-                tmp.append(self._substitute_string(x))
-            elif isinstance(x, list):
-                tmp.append(self._substitute_list(x))
-            else:
-                tmp.append(x)
-        return tmp
-
     def _post_process_config(self):
         """Post process the configuration by replacing variables"""
 
@@ -94,7 +208,9 @@ class Environment:
             options[key] = os.environ.get(f"ODOO_{key.upper()}") or value
 
         # Run the substitution on the configuration
-        self._config = self._substitute_dict(self._config)
+        self._resolved, self._resolving = {}, []
+        self._config = self._resolve(())
+        self._resolved = {}
 
         # Combine the addon paths
         current = set(self.get("odoo", "addons_path", default=[]))
@@ -139,13 +255,20 @@ class Environment:
 
     def _load_config(self, cfg, raise_if_missing=True):
         """Load and process a configuration file"""
+        path = os.path.abspath(cfg)
         if not os.path.isfile(cfg) and not raise_if_missing:
             utils.warn(f" * {cfg}")
+            self._files[path] = None
             return
 
         utils.info(f" * {cfg}")
-        with open(cfg, encoding="utf-8") as fp:
-            options = yaml.load(fp, Loader=yaml.FullLoader)
+        with open(cfg, "rb") as fp:
+            content = fp.read()
+
+        stat = os.stat(cfg)
+        digest = hashlib.sha1(content).hexdigest()
+        self._files[path] = [stat.st_mtime_ns, stat.st_size, digest]
+        options = yaml.load(content, Loader=YamlLoader)
 
         # Load all base configuration files first
         extend = options.get(base.SECTION, {}).get("extend")
@@ -180,35 +303,51 @@ class Environment:
 
         return modules
 
-    def _link_modules(self):
-        """Create symlinks to the modules to allow black-/whitelisting"""
-        shutil.rmtree(base.ADDON_PATH, True)
-        os.makedirs(base.ADDON_PATH, exist_ok=True)
-        utils.info("Linking Odoo modules")
+    def _scan_addons(self, path):
+        """Return the sorted modules within a folder as tuples of name and path"""
+        with os.scandir(path) as entries:
+            modules = [
+                (entry.name, entry.path)
+                for entry in entries
+                if entry.is_dir()
+                and os.path.isfile(os.path.join(entry.path, "__manifest__.py"))
+            ]
+        return sorted(modules)
+
+    def _scan_all_addons(self, paths):
+        """Scan multiple folders in parallel keeping the order of the folders"""
+        if not paths:
+            return []
+
+        with ThreadPoolExecutor(max_workers=min(8, len(paths))) as pool:
+            return list(pool.map(self._scan_addons, paths))
+
+    def _collect_modules(self):
+        """Return the modules of the repositories after applying the black-/whitelist
+        as mapping of the module name to the path"""
+        result = {}
 
         path = self.get(base.SECTION, "odoo")
         if path:
-            base_path = f"{path}/addons/base"
-            link_path = os.path.join(base.ADDON_PATH, "base")
-            if not os.path.islink(link_path):
-                os.symlink(base_path, link_path)
+            result["base"] = f"{path}/addons/base"
 
-        linked_modules = set()
-        for repo_src, repo in self.get("repos", default={}).items():
-            target = os.path.abspath(repo.get("addon_path", repo_src))
-            modules = repo.get("modules", [])
-            whitelist = {m for m in modules if not m.startswith("!")}
-            blacklist = {m[1:] for m in modules if m.startswith("!")}
-
-            for module in os.listdir(target):
-                path = os.path.join(target, module)
-                link_path = os.path.join(base.ADDON_PATH, module)
-                # Check if module
-                if not os.path.isfile(os.path.join(path, "__manifest__.py")):
-                    continue
+        repos = list(self.get("repos", default={}).items())
+        targets = [os.path.abspath(repo.get("addon_path", src)) for src, repo in repos]
+
+        scanned = self._scan_all_addons(targets)
 
+        linked_modules = set()
+        for i, (_src, repo) in enumerate(repos):
+            modules = scanned[i]
+            patterns = repo.get("modules", [])
+            matcher = utils.FilterMatcher(
+                {m for m in patterns if not m.startswith("!")},
+                {m[1:] for m in patterns if m.startswith("!")},
+            )
+
+            for module, path in modules:
                 # Apply whitelist and blacklist
-                if not utils.check_filters(module, whitelist, blacklist):
+                if not matcher(module):
                     continue
 
                 # Keep the duplication check to point out setup problems
@@ -216,9 +355,85 @@ class Environment:
                     raise base.DuplicateModule(f"Duplicate module {module!r} found")
 
                 linked_modules.add(module)
+                result.setdefault(module, path)
+
+        return result
+
+    def _get_module_paths(self):
+        """Return all available modules of the environment as mapping of the
+        module name to the path"""
+        modules = self._collect_modules()
+        paths = [
+            path
+            for path in sorted(self.opt("addons_path", default=[]))
+            if path != base.ADDON_PATH and os.path.isdir(path)
+        ]
+        for found in self._scan_all_addons(paths):
+            for module, module_path in found:
+                modules.setdefault(module, module_path)
+        return modules
 
-                if not os.path.islink(link_path):
-                    os.symlink(path, link_path)
+    def _manifests(self):
+        """Return the refreshed manifest index of all available modules"""
+        index = ManifestIndex().refresh(self._get_module_paths())
+        index.save()
+        return index
+
+    def _current_links(self):
+        """Return the symlinks of the addon path as mapping of the module name to
+        the path or None if the addon path doesn't only contain symlinks"""
+        links = {}
+        try:
+            with os.scandir(base.ADDON_PATH) as entries:
+                for entry in entries:
+                    if not entry.is_symlink():
+                        return None
+                    links[entry.name] = os.readlink(entry.path)
+        except OSError:
+            return None
+        return links
+
+    def _link_modules(self):
+        """Create symlinks to the modules to allow black-/whitelisting. The links
+        are built in a staging directory which atomically replaces the addon path
+        if the links changed"""
+        utils.info("Linking Odoo modules")
+        modules = self._collect_modules()
+
+        with utils.file_lock(base.ADDON_PATH):
+            current = self._current_links()
+            if current == modules:
+                return
+
+            if current is not None:
+                stale = sum(1 for k, v in current.items() if modules.get(k) != v)
+                missing = sum(1 for k, v in modules.items() if current.get(k) != v)
+                utils.info(f"Relinking {stale} stale and {missing} missing modules")
+
+            parent, name = os.path.split(base.ADDON_PATH)
+            staging = tempfile.mkdtemp(prefix=f"{name}.gen-", dir=parent)
+            os.chmod(staging, 0o755)
+            for module, path in modules.items():
+                os.symlink(path, os.path.join(staging, module))
+
+            link = f"{staging}.link"
+            os.symlink(staging, link)
+            try:
+                os.replace(link, base.ADDON_PATH)
+            except OSError:
+                # Older versions created the addon path as directory
+                shutil.rmtree(base.ADDON_PATH, True)
+                os.replace(link, base.ADDON_PATH)
+
+            # Drop the previous generations
+            with os.scandir(parent) as entries:
+                for entry in entries:
+                    if (
+                        entry.name.startswith(f"{name}.gen-")
+                        and entry.path != staging
+                        and entry.is_dir(follow_symlinks=False)
+                    ):
+                        shutil.rmtree(entry.path, True)
 
     def _init_odoo(self):
         """Initialize Odoo to enable the module import"""
@@ -255,6 +470,63 @@ class Environment:
 
         return path
 
+    def _db_names(self):
+        """Return the names of the configured databases without loading Odoo"""
+        db_name = self.opt("db_name")
+        if isinstance(db_name, str):
+            db_name = db_name.split(",")
+        if isinstance(db_name, (list, tuple)):
+            return [name.strip() for name in db_name if name and name.strip()]
+        return []
+
+    def _db_name(self):
+        """Return the name of the first configured database without loading Odoo"""
+        return next(iter(self._db_names()), None)
+
+    def _is_odoo_database(self, db_name):
+        """Check if the database was initialized by Odoo"""
+        try:
+            with self._connect(db_name) as cr:
+                cr.execute("SELECT to_regclass('ir_module_module')")
+                return bool(cr.fetchone()[0])
+        except Exception:
+            return False
+
+    def _get_databases(self):
+        """Return the configured databases or all Odoo databases of the server
+        matching the `dbfilter`"""
+        names = self._db_names()
+        if names:
+            return names
+
+        dbfilter = re.compile(self.opt("dbfilter") or ".*")
+        with self._connect("postgres") as cr:
+            cr.execute(
+                "SELECT datname FROM pg_database "
+                "WHERE NOT datistemplate AND datallowconn AND datname != 'postgres' "
+                "ORDER BY datname"
+            )
+            names = [row[0] for row in cr.fetchall() if dbfilter.match(row[0])]
+
+        # Other applications might use the same server
+        return [name for name in names if self._is_odoo_database(name)]
+
+    @contextmanager
+    def _connect(self, db_name):
+        """Open a plain database cursor without loading Odoo"""
+        # pylint: disable=C0415,E0401
+        import psycopg2
+
+        params = {"dbname": db_name}
+        for key in ("host", "port", "user", "password", "sslmode"):
+            value = self.opt(f"db_{key}")
+            if value not in (None, "", False, "False"):
+                params[key] = value
+
+        with closing(psycopg2.connect(**params)) as con:
+            with closing(con.cursor()) as cr:
+                yield cr
+
     def odoo_version(self):
         # pylint: disable=C0415,E0401
         import odoo.release
@@ -308,13 +580,71 @@ class Environment:
             with Environment.manage():
                 yield
 
-    def generate_config(self):
-        """Generate the Odoo configuration file"""
-        utils.info("Generating configuration file")
+    def _pg_max_connections(self):
+        """Return the max_connections of the PostgreSQL server or None"""
+        try:
+            with self._connect(self._db_name() or "postgres") as cr:
+                cr.execute("SHOW max_connections")
+                return int(cr.fetchone()[0])
+        except Exception:
+            return None
+
+    def autotune(self, options):
+        """Derive the worker, memory and connection options from the CPUs, memory
+        and PostgreSQL of the host. Explicit options are kept and used"""
+        cpus = utils.available_cpus()
+        cron = options.get("max_cron_threads")
+        if cron is None:
+            cron = 1 if cpus < 4 else 2
+
+        workers = options.get("workers")
+        memory = utils.available_memory()
+        if memory:
+            # Keep 20% of the memory for the system and the main process
+            budget = int(memory * 0.8)
+            if workers is None:
+                workers = 2 * cpus + 1
+                while (
+                    workers > 2 and budget // (workers + cron) < AUTOTUNE_WORKER_MEMORY
+                ):
+                    workers -= 1
+
+            hard = min(AUTOTUNE_MEMORY_HARD, budget // (int(workers) + int(cron) or 1))
+            if hard >= AUTOTUNE_WORKER_MEMORY:
+                tuned = {"limit_memory_hard": hard, "limit_memory_soft": hard * 4 // 5}
+            else:
+                # Lower limits would recycle the workers after almost every request
+                utils.warn(
+                    f"The memory of {memory >> 20} MiB is too low for {workers} "
+                    "workers. The memory limits aren't autotuned"
+                )
+                tuned = {}
+        else:
+            workers = 2 * cpus + 1 if workers is None else workers
+            tuned = {}
+
+        tuned.update(workers=workers, max_cron_threads=cron)
+        connections = self._pg_max_connections()
+        if connections:
+            # Every worker, cron thread and the main process has its own pool
+            processes = int(workers) + int(cron) + 1
+            tuned["db_maxconn"] = max(2, min(64, connections * 4 // 5 // processes))
+
+        tuned = {k: v for k, v in tuned.items() if options.get(k) is None}
+        if tuned:
+            values = ", ".join(f"{k}={v}" for k, v in sorted(tuned.items()))
+            utils.info(f"Autotuned {values}")
+        return tuned
+
+    def render_config(self):
+        """Render the Odoo configuration file deterministically"""
         cp = configparser.ConfigParser()
 
         # Generate the configuration with the sections
         options = self.get("odoo", "options", default={})
+        if utils.tobool(self.get(base.SECTION, "autotune", default=False)):
+            options = dict(options, **self.autotune(options))
+
         for key, value in sorted(options.items()):
             if key == "load_language":
                 continue
@@ -327,17 +657,51 @@ class Environment:
             if not cp.has_section(sec):
                 cp.add_section(sec)
 
-            if isinstance(value, (set, list)):
+            if isinstance(value, set):
+                cp.set(sec, key, ",".join(sorted(map(str, value))))
+            elif isinstance(value, list):
                 cp.set(sec, key, ",".join(map(str, value)))
             elif value is None:
                 cp.set(sec, key, "")
             else:
                 cp.set(sec, key, str(value))
 
+        fp = io.StringIO()
+        cp.write(fp)
+        return fp.getvalue()
+
+    def generate_config(self, check=False):
+        """Generate the Odoo configuration file. The file is only replaced if the
+        content changed. With check the differences are only reported"""
+        utils.info("Generating configuration file")
+        content = self.render_config()
+
+        try:
+            with open(base.ODOO_CONFIG, encoding="utf-8") as fp:
+                current = fp.read()
+        except OSError:
+            current = None
+
+        if current == content:
+            utils.info("Configuration file is up to date")
+            return 0
+
+        if check:
+            utils.warn(f"Configuration file {base.ODOO_CONFIG} is outdated")
+            return 1
+
+        # Write the configuration atomically
         os.makedirs(os.path.dirname(base.ODOO_CONFIG), exist_ok=True)
-        # Write the configuration
-        with open(base.ODOO_CONFIG, "w+", encoding="utf-8") as fp:
-            cp.write(fp)
+        tmp = f"{base.ODOO_CONFIG}.{os.getpid()}.tmp"
+        with open(tmp, "w+", encoding="utf-8") as fp:
+            fp.write(content)
+        os.replace(tmp, base.ODOO_CONFIG)
+        return 0
+
+    def generate(self, args=None):
+        """Generate or check the Odoo configuration file"""
+        args, _ = load_generate_arguments(args or [])
+        return self.generate_config(check=args.check)
 
     def config(self, args=None):
         """Simply output the rendered configuration file"""
@@ -0,0 +1,31 @@
+# © 2026 initOS GmbH
+# License Apache-2.0 (http://www.apache.org/licenses/).
+
+import glob
+import os
+import sys
+
+from . import base, utils
+
+
+def run_each(pattern, command, args, jobs=4, log_level="info"):
+    """Run a dob command for every configuration file matching the pattern in
+    parallel processes and print a summary"""
+    configs = sorted(glob.glob(pattern, recursive=True))
+    if not configs:
+        utils.error(f"No configuration file matches {pattern}")
+        return 1
+
+    commands = {}
+    for cfg in configs:
+        cmd = [sys.executable, "-m", "doblib", "-c", os.path.basename(cfg)]
+        cmd += ["--logging", log_level, command, *args]
+        cwd = os.path.dirname(cfg) or "."
+        commands[os.path.relpath(cfg)] = cmd, dict(os.environ), cwd
+
+    log_dir = os.path.join(base.CACHE_PATH, "each")
+    utils.info(f"Running {command} for {len(configs)} projects")
+    results = utils.run_parallel(commands, jobs, log_dir=log_dir)
+    print(utils.summary(results))
+    utils.info(f"Logs written to {log_dir}")
+    return 1 if any(code for code, _ in results.values()) else 0
@@ -0,0 +1,113 @@
+# © 2026 initOS GmbH
+# License Apache-2.0 (http://www.apache.org/licenses/).
+
+import ast
+import os
+
+from . import base, utils
+
+MANIFEST = "__manifest__.py"
+
+
+def read_manifest(path):
+    """Parse a manifest file without executing any code"""
+    try:
+        with open(path, encoding="utf-8") as fp:
+            manifest = ast.literal_eval(fp.read())
+    except (OSError, ValueError, SyntaxError):
+        utils.warn(f"Invalid manifest {path}")
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+
+class ManifestIndex:
+    """Persistent index of the module manifests. Manifests are only parsed again
+    if the mtime or size of the file changed"""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(base.CACHE_PATH, "manifests.json")
+        self.modules = {}
+        self._reverse = None
+        self.load()
+
+    def load(self):
+        """Load the index from the file"""
+        data = utils.read_json(self.path)
+        if isinstance(data, dict):
+            self.modules = data
+
+    def save(self):
+        """Write the index back to the file"""
+        utils.write_json(self.path, self.modules)
+
+    def refresh(self, modules):
+        """Update the index with the modules given as mapping to the path. Modules
+        which aren't available anymore are dropped"""
+        result = {}
+        for name, path in modules.items():
+            manifest_path = os.path.join(path, MANIFEST)
+            try:
+                stat = os.stat(manifest_path)
+            except OSError:
+                continue
+
+            cached = self.modules.get(name)
+            if (
+                cached
+                and cached["path"] == path
+                and cached["stat"] == [stat.st_mtime_ns, stat.st_size]
+            ):
+                result[name] = cached
+                continue
+
+            manifest = read_manifest(manifest_path)
+            result[name] = {
+                "path": path,
+                "stat": [stat.st_mtime_ns, stat.st_size],
+                "version": manifest.get("version", ""),
+                "depends": list(manifest.get("depends", [])),
+                "auto_install": manifest.get("auto_install", False),
+                "installable": manifest.get("installable", True),
+                "data": list(manifest.get("data", [])),
+                "demo": list(manifest.get("demo", [])),
+            }
+
+        self.modules = result
+        self._reverse = None
+        return self
+
+    def get(self, name, key=None, default=None):
+        """Return the manifest information of a module"""
+        info = self.modules.get(name)
+        if info is None:
+            return default
+        if key is None:
+            return info
+        return info.get(key, default)
+
+    def _closure(self, names, graph):
+        """Return the transitive closure of the names within the graph"""
+        result = set()
+        todo = list(names)
+        while todo:
+            name = todo.pop()
+            if name in result:
+                continue
+
+            result.add(name)
+            todo.extend(graph(name))
+        return result
+
+    def dependencies(self, names):
+        """Return the modules including all their dependencies"""
+        return self._closure(names, lambda name: self.get(name, "depends", []))
+
+    def dependents(self, names):
+        """Return the modules including all modules which depend on them"""
+        if self._reverse is None:
+            self._reverse = {}
+            for name, info in self.modules.items():
+                for dep in info["depends"]:
+                    self._reverse.setdefault(dep, []).append(name)
+
+        return self._closure(names, lambda name: self._reverse.get(name, []))
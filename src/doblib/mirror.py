@@ -0,0 +1,140 @@
+# © 2026 initOS GmbH
+# License Apache-2.0 (http://www.apache.org/licenses/).
+
+import hashlib
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from git_aggregator.repo import FETCH_DEFAULTS
+
+from . import utils
+
+# Namespace of the refs fetched into the mirrors
+REF_PREFIX = "refs/mirror"
+
+
+def mirror_ref(ref):
+    """Return the name of the ref in the mirror"""
+    if ref.startswith("refs/"):
+        ref = ref[5:]
+    return f"{REF_PREFIX}/{ref}"
+
+
+def git(*args, cwd=None):
+    """Run a git command and return the output"""
+    return subprocess.run(
+        ["git", *args],
+        cwd=cwd,
+        check=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    ).stdout
+
+
+class MirrorCache:
+    """Bare mirror repository per remote URL shared between all repositories
+    fetching from it. The repositories borrow the objects via git alternates
+    and the mirrors must not be deleted"""
+
+    def __init__(self, path):
+        self.path = path
+        self.refspecs = {}
+        self.mirrored = {}
+
+    def mirror_path(self, url):
+        """Return the path of the mirror of the URL"""
+        name = hashlib.sha1(url.encode()).hexdigest()[:16]
+        return os.path.join(self.path, f"{name}.git")
+
+    def collect(self, repo_dict):
+        """Collect the refs of the repository which should be mirrored"""
+        defaults = repo_dict.get("defaults") or {}
+        merges = repo_dict.get("merges") or []
+        # Shallow mirrors can't serve as alternates
+        if any(
+            merge.get(opt, defaults.get(opt))
+            for merge in merges
+            for opt in FETCH_DEFAULTS
+        ):
+            return
+
+        urls = {remote["name"]: remote["url"] for remote in repo_dict["remotes"]}
+        fetch_all = repo_dict.get("fetch_all") or ()
+        for merge in merges:
+            url = urls.get(merge["remote"])
+            if not url:
+                continue
+
+            refspecs = self.refspecs.setdefault(url, set())
+            if merge["remote"] in fetch_all:
+                refspecs.add(f"+refs/heads/*:{REF_PREFIX}/heads/*")
+            else:
+                refspecs.add(f"+{merge['ref']}:{mirror_ref(merge['ref'])}")
+            self.mirrored.setdefault(repo_dict["cwd"], set()).add(url)
+
+    def fetch(self, url):
+        """Fetch all collected refs of the URL into its mirror"""
+        path = self.mirror_path(url)
+        with utils.file_lock(path):
+            if not os.path.isdir(path):
+                git("init", "--quiet", "--bare", path)
+                # The objects must stay because other repositories borrow them
+                git("config", "gc.auto", "0", cwd=path)
+                git("config", "gc.pruneExpire", "never", cwd=path)
+                git("config", "dob.url", url, cwd=path)
+
+            git(
+                "fetch",
+                "--quiet",
+                "--no-tags",
+                url,
+                *sorted(self.refspecs[url]),
+                cwd=path,
+            )
+
+    def update(self, jobs=1):
+        """Fetch the refs of all mirrors once. Returns the URLs which failed"""
+        failed = set()
+        with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+            futures = {url: executor.submit(self.fetch, url) for url in self.refspecs}
+            for url, future in futures.items():
+                try:
+                    future.result()
+                except subprocess.CalledProcessError as e:
+                    utils.warn(f"Mirroring {url} failed: {(e.output or '').strip()}")
+                    failed.add(url)
+
+        for url in failed:
+            self.refspecs.pop(url, None)
+            for urls in self.mirrored.values():
+                urls.discard(url)
+        return failed
+
+    def link(self, cwd):
+        """Link the repository to the mirrors of its remotes. New repositories are
+        initialized to prevent a full clone"""
+        urls = self.mirrored.get(cwd)
+        if not urls:
+            return False
+
+        if not os.path.exists(cwd) or not os.listdir(cwd):
+            git("init", "--quiet", cwd)
+        elif not os.path.isdir(os.path.join(cwd, ".git")):
+            return False
+
+        path = os.path.join(cwd, ".git", "objects", "info", "alternates")
+        try:
+            with open(path, encoding="utf-8") as fp:
+                alternates = fp.read().splitlines()
+        except FileNotFoundError:
+            alternates = []
+
+        objects = [os.path.join(self.mirror_path(url), "objects") for url in urls]
+        missing = sorted(set(objects).difference(alternates))
+        if missing:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w+", encoding="utf-8") as fp:
+                fp.write("".join(f"{line}\n" for line in alternates + missing))
+        return True
@@ -2,12 +2,32 @@
 # License Apache-2.0 (http://www.apache.org/licenses/).
 
 import argparse
+import hashlib
 import importlib
+import json
 import os
 import sys
-from contextlib import closing
-
-from . import base, env, utils
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing, nullcontext
+
+from . import base, env, sql, utils
+from .checksum import (
+    ChecksumIndex,
+    changed_modules,
+    file_hash,
+    read_checksums,
+    store_checksums,
+)
+from .profile import ModuleProfiler
+from .translation import TranslationCache
+
+# Key of the fingerprint of the last update in the `ir.config_parameter`
+FINGERPRINT_KEY = "db_fingerprint"
+# Scripts which are executed during an update
+UPDATE_SCRIPTS = ("pre_install", "pre_update", "post_update")
+# Asset bundles which are requested by nearly every user
+ASSET_BUNDLES = ("web.assets_web", "web.assets_frontend")
 
 
 def no_flags(x):
@@ -37,6 +57,76 @@ def load_update_arguments(args):
         default=False,
         help="Update all listed modules instead of only changed ones",
     )
+    parser.add_argument(
+        "--changed-closure",
+        action="store_true",
+        default=False,
+        help="Update the changed modules of the checksum index and all modules "
+        "depending on them",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        default=False,
+        help="Record the time spent per module and write a report to PREFIX.txt "
+        "and a flame graph trace to PREFIX.folded",
+    )
+    parser.add_argument(
+        "--profile-prefix",
+        default="update-profile",
+        metavar="PREFIX",
+        help="Prefix of the files written by --profile. Default: %(default)s",
+    )
+    parser.add_argument(
+        "-d",
+        "--database",
+        default=None,
+        help="Update this database instead of the configured one",
+    )
+    parser.add_argument(
+        "--all-databases",
+        action="store_true",
+        default=False,
+        help="Update all configured databases or all databases matching the "
+        "`dbfilter` in separate processes",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        default=1,
+        type=int,
+        help="Number of databases updated in parallel with --all-databases. "
+        "Default %(default)s",
+    )
+    parser.add_argument(
+        "--prewarm-assets",
+        action="store_true",
+        default=False,
+        help="Generate the common asset bundles for the configured languages "
+        "after the update",
+    )
+    parser.add_argument(
+        "--asset-jobs",
+        default=1,
+        type=int,
+        metavar="N",
+        help="Number of asset bundles generated in parallel with "
+        "--prewarm-assets. Default %(default)s",
+    )
+    parser.add_argument(
+        "--no-initialize",
+        dest="initialize",
+        action="store_false",
+        default=True,
+        help="Fail instead of initializing a database without Odoo",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        default=False,
+        help="Only print the modules which would be installed and upgraded and "
+        "the scripts which would run without loading Odoo",
+    )
     parser.add_argument(
         "--passwords",
         action="store_true",
@@ -49,6 +139,13 @@ def load_update_arguments(args):
 class ModuleEnvironment(env.Environment):
     """Class to handle modules"""
 
+    def _migration_path(self, script_name):
+        """Return the path of a migration script if it exists"""
+        for path in (f"{script_name}.py", script_name):
+            if os.path.exists(path):
+                return path
+        return None
+
     def _run_migration(self, db_name, script_name):
         """Run a migration script by executing the migrate function"""
         path = sys.path[:]
@@ -68,7 +165,9 @@ class ModuleEnvironment(env.Environment):
             script.migrate(env, version)
 
     def _run_migration_sql(self, db_name, script_name):
-        """Run a migration SQL script"""
+        """Run a migration SQL script statement by statement. The transaction is
+        committed at `-- dob: commit` comment lines of the script and at the end
+        of scripts using them"""
         if not os.path.isfile(script_name):
             return
 
@@ -81,80 +180,133 @@ class ModuleEnvironment(env.Environment):
         # Ensure that the database is initialized
         db = odoo.sql_db.db_connect(db_name)
         with closing(db.cursor()) as cr, open(script_name, encoding="utf-8") as f:
-            cr.execute(f.read())
+            sql.execute_script(cr, f)
 
     def _get_installed_modules(self, db_name):
-        """Return the list of modules which are installed"""
-        with self.env(db_name, False, minimal=True) as env:
-            domain = [("state", "=", "installed")]
-            installed = env["ir.module.module"].search(domain).mapped("name")
-            return set(installed).union(["base"])
+        """Return the list of modules which are installed. They are read with plain
+        SQL because building a registry only for this is expensive"""
+        # pylint: disable=C0415,E0401
+        import odoo.sql_db
 
-    def install_all(self, db_name, modules):
-        """Install all modules"""
+        db = odoo.sql_db.db_connect(db_name)
+        with closing(db.cursor()) as cr:
+            cr.execute("SELECT name FROM ir_module_module WHERE state = 'installed'")
+            return {row[0] for row in cr.fetchall()}.union(["base"])
+
+    def load_registry(self, db_name, install=None, upgrade=None):
+        """Load the registry and install and upgrade the modules within the same
+        load. The registry is only rebuilt if the module graph changes otherwise
+        the already loaded registry is reused"""
         # pylint: disable=C0415,E0401,W0611
         # ruff: noqa: F401
         import odoo
         from odoo.modules.registry import Registry
         from odoo.tools import config
 
-        config["init"] = dict.fromkeys(modules, 1)
+        install, upgrade = set(install or []), set(upgrade or [])
+        if not install and not upgrade:
+            # Odoo caches loaded registries per database
+            return Registry(db_name)
+
+        config["init"] = dict.fromkeys(install, 1)
         config["update"] = {}
         config["overwrite_existing_translations"] = True
-        without_demo = utils.tobool(self.opt("without_demo", default=True))
-        languages = self.opt("load_language")
-        if languages and isinstance(languages, list):
-            config["load_language"] = ",".join(languages)
-        elif languages:
-            config["load_language"] = languages
-
         kwargs = {"update_module": True}
-        if self.odoo_version() < (19,):
-            kwargs["force_demo"] = not without_demo
-        else:
-            kwargs["install_modules"] = list(modules)
+        if install:
+            without_demo = utils.tobool(self.opt("without_demo", default=True))
+            languages = self.opt("load_language")
+            if languages and isinstance(languages, list):
+                config["load_language"] = ",".join(languages)
+            elif languages:
+                config["load_language"] = languages
+
+            if self.odoo_version() < (19,):
+                kwargs["force_demo"] = not without_demo
+            else:
+                kwargs["install_modules"] = sorted(install)
 
-        Registry.new(db_name, **kwargs)
+        if upgrade:
+            if self.odoo_version() < (19,):
+                config["update"] = dict.fromkeys(upgrade, 1)
+            else:
+                kwargs["upgrade_modules"] = sorted(upgrade)
 
-    def check_auto_install(self, db_name):
-        """Install auto installable modules if the dependencies are installed"""
+        return Registry.new(db_name, **kwargs)
+
+    def install_all(self, db_name, modules):
+        """Install all modules"""
+        self.load_registry(db_name, install=modules)
+
+    def _get_auto_install_modules(self, env):
+        """Return the ids of the auto installable modules whose dependencies are
+        installed or get installed. The module graph is read with a single query
+        and resolved with a worklist over the number of missing dependencies"""
         states = frozenset(("installed", "to install", "to upgrade"))
 
-        with self.env(db_name, False, minimal=True) as env:
-            countries = env["res.company"].search([]).mapped("country_id")
-
-            domain = [("state", "=", "uninstalled"), ("auto_install", "=", True)]
-            modules = env["ir.module.module"].search(domain)
-            auto_install = {module: module.dependencies_id for module in modules}
-
-            to_install = env["ir.module.module"].browse()
-            new_module = True
-            while new_module:
-                new_module = False
-                for module, dependencies in auto_install.items():
-                    if (
-                        "country_ids" in module._fields
-                        and module.country_ids
-                        and not (module.country_ids & countries)
-                    ):
-                        continue
-
-                    if all(
-                        dep.state in states or dep.depend_id in to_install
-                        for dep in dependencies
-                    ):
-                        to_install |= module
-                        new_module = True
-
-                auto_install = {
-                    mod: deps
-                    for mod, deps in auto_install.items()
-                    if mod not in to_install
-                }
+        env.cr.execute("""SELECT m.id, m.name, d.name
+            FROM ir_module_module m
+            LEFT JOIN ir_module_module_dependency d ON d.module_id = m.id
+            WHERE m.state = 'uninstalled' AND m.auto_install""")
+        candidates, dependencies = {}, {}
+        for module_id, name, dependency in env.cr.fetchall():
+            candidates[name] = module_id
+            deps = dependencies.setdefault(name, set())
+            if dependency:
+                deps.add(dependency)
+
+        # Skip modules which are restricted to countries of no company
+        field = env["ir.module.module"]._fields.get("country_ids")
+        if field and candidates:
+            countries = set(env["res.company"].search([]).mapped("country_id").ids)
+            restricted = {}
+            env.cr.execute(
+                f"SELECT {field.column1}, {field.column2} FROM {field.relation} "
+                f"WHERE {field.column1} IN %s",
+                (tuple(candidates.values()),),
+            )
+            for module_id, country_id in env.cr.fetchall():
+                restricted.setdefault(module_id, set()).add(country_id)
+
+            for name, module_id in list(candidates.items()):
+                if module_id in restricted and not restricted[module_id] & countries:
+                    candidates.pop(name)
+
+        names = {dep for deps in dependencies.values() for dep in deps}
+        satisfied = set()
+        if names:
+            env.cr.execute(
+                "SELECT name FROM ir_module_module WHERE name IN %s AND state IN %s",
+                (tuple(names), tuple(states)),
+            )
+            satisfied = {row[0] for row in env.cr.fetchall()}
+
+        # Count the missing dependencies and remember the dependent modules
+        missing, dependents = {}, {}
+        for name in candidates:
+            deps = dependencies[name].difference(satisfied)
+            missing[name] = len(deps)
+            for dep in deps:
+                dependents.setdefault(dep, []).append(name)
+
+        to_install = []
+        worklist = [name for name, count in missing.items() if not count]
+        while worklist:
+            name = worklist.pop()
+            to_install.append(candidates[name])
+            for dependent in dependents.get(name, []):
+                missing[dependent] -= 1
+                if not missing[dependent]:
+                    worklist.append(dependent)
+
+        return sorted(to_install)
 
+    def check_auto_install(self, db_name):
+        """Install auto installable modules if the dependencies are installed"""
+        with self.env(db_name, False, minimal=True) as env:
+            to_install = self._get_auto_install_modules(env)
             if to_install:
                 utils.info("Installing auto_install modules")
-                to_install.button_immediate_install()
+                env["ir.module.module"].browse(to_install).button_immediate_install()
 
     def update_checksums(self, db_name):
         """Only update the module checksums in the database"""
@@ -164,44 +316,193 @@ class ModuleEnvironment(env.Environment):
                 utils.info("Updating module checksums")
                 model._save_installed_checksums()
 
-    def update_specific(
+    def _get_specific_modules(
         self, db_name, whitelist=None, blacklist=None, installed=False, listed=False
     ):
-        """Update all modules"""
-        # pylint: disable=C0415,E0401,W0611
-        # ruff: noqa: F401
-        import odoo
-        from odoo.modules.registry import Registry
-        from odoo.tools import config
-
+        """Return the modules to update"""
         whitelist = set(whitelist or [])
 
         if installed:
             utils.info("Updating all modules")
-            modules = ["base"]
-        elif listed:
+            return {"base"}
+
+        if listed:
             utils.info("Updating listed modules")
-            modules = self._get_modules()
-        else:
-            utils.info("Updating specific modules")
-            modules = self._get_installed_modules(db_name)
+            return set(self._get_modules())
 
-            modules = (modules or whitelist).intersection(whitelist)
-            modules.difference_update(blacklist or [])
+        utils.info("Updating specific modules")
+        modules = self._get_installed_modules(db_name)
 
-        config["init"] = {}
-        config["overwrite_existing_translations"] = True
-        kwargs = {"update_module": True}
-        if self.odoo_version() < (19,):
-            config["update"] = dict.fromkeys(modules, 1)
-        else:
-            kwargs["upgrade_modules"] = list(modules)
+        modules = (modules or whitelist).intersection(whitelist)
+        modules.difference_update(blacklist or [])
+        return modules
+
+    def _get_changed_modules(self, db_name, blacklist=None, changed=None):
+        """Return the changed modules to update"""
+        utils.info("Updating changed modules")
+        if changed is None:
+            with self.env(db_name, False, minimal=True) as env:
+                model = env["ir.module.module"]
+                if not hasattr(model, "_get_modules_with_changed_checksum"):
+                    utils.info("The module module_auto_update is needed. Falling back")
+                    return {"base"}
+
+                changed = model._get_modules_with_changed_checksum().mapped("name")
+
+        installed = self._get_installed_modules(db_name)
+        return installed.intersection(changed).difference(blacklist or [])
+
+    def update_specific(
+        self, db_name, whitelist=None, blacklist=None, installed=False, listed=False
+    ):
+        """Update all modules"""
+        modules = self._get_specific_modules(
+            db_name, whitelist, blacklist, installed=installed, listed=listed
+        )
+        self.load_registry(db_name, upgrade=modules)
+
+    def _checksum_index(self):
+        """Return the checksum index if needed by the configuration"""
+        keys = ("checksums", "fingerprint")
+        if any(utils.tobool(self.get(base.SECTION, k, default=False)) for k in keys):
+            return ChecksumIndex()
+        return None
+
+    def _fingerprint(self, index, checksums):
+        """Calculate a fingerprint of everything which influences an update if
+        enabled in the configuration"""
+        if not utils.tobool(self.get(base.SECTION, "fingerprint", default=False)):
+            return None
+
+        def serialize(value):
+            if isinstance(value, set):
+                return sorted(map(str, value))
+            return str(value)
+
+        scripts = {}
+        for name in UPDATE_SCRIPTS:
+            path = self._migration_path(name)
+            if path and os.path.isfile(path):
+                scripts[name] = file_hash(path)
+            elif path:
+                scripts[name] = index.module_checksum(path)
+
+        data = {
+            "checksums": checksums,
+            "modules": sorted(self._get_modules()),
+            "options": self.get("odoo", "options", default={}),
+            "scripts": scripts,
+            "version": self.get(base.SECTION, "version", default="0.0"),
+        }
+        data = json.dumps(data, sort_keys=True, default=serialize)
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def _translation_cache(self, db_name):
+        """Return the translation cache with the stored checksums of the PO files
+        if enabled in the configuration"""
+        key = "translation_cache"
+        if not utils.tobool(self.get(base.SECTION, key, default=False)):
+            return None
+
+        # pylint: disable=C0415,E0401
+        import odoo.sql_db
+
+        index = ChecksumIndex(os.path.join(base.CACHE_PATH, "translations.json"))
+        checksums = {
+            name: index.translation_checksum(path)
+            for name, path in self._get_module_paths().items()
+        }
+        index.save()
 
-        Registry.new(db_name, **kwargs)
+        languages = self.opt("load_language") or []
+        if isinstance(languages, str):
+            languages = languages.split(",")
 
-    def update_changed(self, db_name, blacklist=None):
+        db = odoo.sql_db.db_connect(db_name)
+        with closing(db.cursor()) as cr:
+            cr.execute("SELECT code FROM res_lang WHERE active")
+            languages = {lang.strip() for lang in languages if lang.strip()}
+            languages.update(row[0] for row in cr.fetchall())
+            cache = TranslationCache(checksums, languages).read(cr)
+            cr.commit()
+        return cache
+
+    def _store_translation_cache(self, db_name, cache):
+        """Store the checksums of the loaded translations in the database"""
+        # pylint: disable=C0415,E0401
+        import odoo.sql_db
+
+        db = odoo.sql_db.db_connect(db_name)
+        with closing(db.cursor()) as cr:
+            cache.store(cr)
+            cr.commit()
+
+    def _stored_fingerprint(self, db_name):
+        """Read the fingerprint of the last update directly from the database"""
+        if not db_name:
+            return None
+
+        try:
+            with self._connect(db_name) as cr:
+                cr.execute(
+                    "SELECT value FROM ir_config_parameter WHERE key = %s",
+                    (FINGERPRINT_KEY,),
+                )
+                row = cr.fetchone()
+        except Exception:
+            return None
+        return row[0] if row else None
+
+    def _stored_checksums(self, db_name):
+        """Read the module checksums of the last update directly from the
+        database"""
+        if not db_name:
+            return None
+
+        try:
+            with self._connect(db_name) as cr:
+                return read_checksums(cr)
+        except Exception:
+            return None
+
+    def _store_checksums(self, db_name, checksums):
+        """Store the module checksums of the update in the database"""
+        # pylint: disable=C0415,E0401
+        import odoo.sql_db
+
+        db = odoo.sql_db.db_connect(db_name)
+        with closing(db.cursor()) as cr:
+            store_checksums(cr, checksums)
+            cr.commit()
+
+    def _get_index_changes(self, db_name, index, checksums, closure=False):
+        """Return the changed modules of the checksum index including the modules
+        depending on them if closure is set. None is returned if unknown"""
+        enabled = utils.tobool(self.get(base.SECTION, "checksums", default=False))
+        if not index or not (enabled or closure):
+            return None
+
+        changed = changed_modules(self._stored_checksums(db_name), checksums)
+        if changed is None:
+            if closure:
+                utils.warn("No checksums stored for the database. Falling back")
+            return None
+
+        if closure and changed:
+            changed = self._manifests().dependents(changed)
+            utils.info(f"Changed modules with dependents: {len(changed)}")
+        return changed
+
+    def update_changed(self, db_name, blacklist=None, changed=None):
         """Update only changed modules"""
         utils.info("Updating changed modules")
+        if changed is not None:
+            # The changed modules are already known from the checksum index
+            if changed:
+                self.update_specific(db_name, whitelist=changed, blacklist=blacklist)
+            self.update_checksums(db_name)
+            return
+
         with self.env(db_name, False, minimal=True) as env:
             model = env["ir.module.module"]
             if hasattr(model, "upgrade_changed_checksum"):
@@ -211,12 +512,320 @@ class ModuleEnvironment(env.Environment):
         utils.info("The module module_auto_update is needed. Falling back")
         self.update_specific(db_name, blacklist=blacklist, installed=True)
 
+    def _get_uninstalled_modules(self, db_name, args, initialized):
+        """Return the modules which must be installed"""
+        if initialized:
+            return self._get_modules()
+
+        installed = self._get_installed_modules(db_name)
+        modules = self._get_modules()
+        if args.modules:
+            modules.update(args.modules)
+
+        return modules.difference(installed)
+
+    def _install_and_update(self, db_name, args, initialized, uninstalled, changed):
+        """Install and update the modules. Both happen within a single registry
+        load if the pre update script doesn't have to run in between"""
+        if initialized or self._migration_path("pre_update"):
+            # Install all modules
+            if uninstalled:
+                utils.info("Installing all modules")
+                self.install_all(db_name, uninstalled)
+
+            # Check for auto install modules
+            self.check_auto_install(db_name)
+
+            # Execute the pre update script
+            self._run_migration(db_name, "pre_update")
+
+            # Update all modules which aren't installed before
+            if initialized:
+                self.update_checksums(db_name)
+            elif args.all or args.listed or args.modules:
+                self.update_specific(
+                    db_name,
+                    whitelist=args.modules,
+                    blacklist=uninstalled,
+                    installed=args.all,
+                    listed=args.listed,
+                )
+            else:
+                self.update_changed(db_name, uninstalled, changed=changed)
+            return
+
+        if args.all or args.listed or args.modules:
+            upgrade = self._get_specific_modules(
+                db_name,
+                whitelist=args.modules,
+                blacklist=uninstalled,
+                installed=args.all,
+                listed=args.listed,
+            )
+        else:
+            upgrade = self._get_changed_modules(db_name, uninstalled, changed)
+
+        if uninstalled:
+            utils.info("Installing all modules")
+        self.load_registry(db_name, install=uninstalled, upgrade=upgrade)
+
+        # The stored checksums are only valid if all changes were applied
+        if not args.listed and not args.modules:
+            self.update_checksums(db_name)
+
+        # Check for auto install modules
+        self.check_auto_install(db_name)
+
+    def _asset_directions(self, db_name):
+        """Return the text directions of the configured languages"""
+        languages = self.opt("load_language") or []
+        if isinstance(languages, str):
+            languages = languages.split(",")
+
+        languages = {lang.strip() for lang in languages if lang.strip()}
+        with self.env(db_name, rollback=True) as env:
+            domain = [("code", "in", sorted(languages.union(["en_US"])))]
+            model = env["res.lang"].with_context(active_test=False)
+            return sorted({lang.direction == "rtl" for lang in model.search(domain)})
+
+    def prewarm_assets(self, db_name, jobs=1):
+        """Generate the asset bundles to prevent the generation during the first
+        requests after an update"""
+        if self.odoo_version() < (17,):
+            utils.warn("Prewarming asset bundles requires Odoo 17 or later")
+            return
+
+        bundles = self.get(base.SECTION, "prewarm_bundles", default=ASSET_BUNDLES)
+        directions = self._asset_directions(db_name) or [False]
+        tasks = [(bundle, rtl) for bundle in bundles for rtl in directions]
+
+        def generate(bundle, rtl):
+            start = time.perf_counter()
+            with self.env(db_name) as env:
+                qweb = env["ir.qweb"]
+                assets = qweb._get_asset_bundle(bundle, css=True, js=True, rtl=rtl)
+                assets.css()
+                assets.js()
+            return time.perf_counter() - start
+
+        utils.info(f"Prewarming {len(tasks)} asset bundles")
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+            futures = {pool.submit(generate, *task): task for task in tasks}
+            for future in as_completed(futures):
+                bundle, rtl = futures[future]
+                name = f"{bundle} (rtl)" if rtl else bundle
+                try:
+                    utils.info(f"Generated {name} in {future.result():.2f}s")
+                except Exception as e:
+                    utils.warn(f"Failed to generate {name}: {e}")
+
+    def _read_module_states(self, db_name):
+        """Read the state and version of the modules with plain SQL. None is
+        returned if the database isn't initialized"""
+        try:
+            with self._connect(db_name) as cr:
+                cr.execute("SELECT name, state, latest_version FROM ir_module_module")
+                return {
+                    name: (state, version) for name, state, version in cr.fetchall()
+                }
+        except Exception:
+            return None
+
+    def _plan_version_changes(self, manifests, states):
+        """Return the installed modules whose manifest version differs from the
+        version in the database"""
+        version = (states.get("base") or (None, None))[1] or ""
+        series = ".".join(version.split(".")[:2])
+
+        changed = set()
+        for name, (_state, db_version) in states.items():
+            version = manifests.get(name, "version")
+            if not version or not series:
+                continue
+            if version == series or not version.startswith(f"{series}."):
+                version = f"{series}.{version}"
+            if version != db_version:
+                changed.add(name)
+        return changed
+
+    def _plan_auto_install(self, manifests, modules):
+        """Return the auto installable modules whose dependencies are satisfied"""
+        modules, result = set(modules), set()
+        found = True
+        while found:
+            found = False
+            for name, info in manifests.modules.items():
+                auto_install = info.get("auto_install")
+                if not auto_install or name in modules or not info["installable"]:
+                    continue
+
+                depends = auto_install if isinstance(auto_install, list) else []
+                if set(depends or info["depends"]).issubset(modules):
+                    modules.update(manifests.dependencies([name]))
+                    result.add(name)
+                    found = True
+        return result
+
+    def plan(self, args):
+        """Return the plan of an update computed from the manifests and the module
+        states in the database without loading Odoo"""
+        db_name = self._db_name()
+        manifests = self._manifests()
+        states = self._read_module_states(db_name)
+        initialize = states is None
+        states = {
+            name: values
+            for name, values in (states or {}).items()
+            if values[0] in ("installed", "to upgrade", "to remove")
+        }
+        installed = set(states).union(["base"])
+
+        wanted = self._get_modules().union(args.modules)
+        install = manifests.dependencies(wanted).difference(installed)
+        if initialize:
+            install.add("base")
+
+        changed, reason = None, "checksums"
+        if initialize:
+            upgrade = set()
+        elif args.all:
+            upgrade, reason = {"base"}, "all"
+        elif args.listed or args.modules:
+            upgrade = set(self._get_modules() if args.listed else args.modules)
+            reason = "listed" if args.listed else "specific"
+        else:
+            index = self._checksum_index()
+            if not index and args.changed_closure:
+                index = ChecksumIndex()
+            if index:
+                checksums = index.checksums(self._get_module_paths())
+                changed = self._get_index_changes(
+                    db_name, index, checksums, closure=args.changed_closure
+                )
+            if changed is None:
+                changed, reason = (
+                    self._plan_version_changes(manifests, states),
+                    "version",
+                )
+            upgrade = set(changed)
+
+        # Odoo upgrades all modules depending on an upgraded module
+        upgrade = manifests.dependents(upgrade).intersection(installed) - install
+        auto_install = self._plan_auto_install(manifests, installed | install)
+
+        scripts = [path for path in map(self._migration_path, UPDATE_SCRIPTS) if path]
+
+        def line(title, names):
+            names = sorted(names)
+            return f"{title} ({len(names)}): {', '.join(names) or '-'}"
+
+        state = "initialize" if initialize else "update"
+        return "\n".join(
+            [
+                f"Database: {db_name} ({state})",
+                line("Install", install),
+                line(f"Upgrade [{reason}]", upgrade),
+                line("Auto install candidates", auto_install),
+                line("Scripts", scripts),
+            ]
+        )
+
+    def _update_databases(self, args, raw_args):
+        """Run the update for each database in a separate process"""
+        discovered = not self._db_names()
+        databases = self._get_databases()
+        if not databases:
+            utils.error("No database found")
+            return 1
+
+        # Strip the arguments which would recursively spawn processes
+        worker_args, skip = [], False
+        for arg in raw_args:
+            if skip:
+                skip = False
+            elif arg in ("-j", "--jobs", "-d", "--database"):
+                skip = True
+            elif arg != "--all-databases" and not arg.startswith(
+                ("--jobs=", "--database=")
+            ):
+                worker_args.append(arg)
+
+        commands = {}
+        for db_name in databases:
+            cmd = [sys.executable, "-m", "doblib", "update", "-c", self._cfg]
+            cmd += ["--database", db_name, *worker_args]
+            if discovered:
+                # Never initialize databases which might belong to others
+                cmd.append("--no-initialize")
+            if args.profile:
+                # Each database writes its own report
+                cmd.append(f"--profile-prefix={args.profile_prefix}.{db_name}")
+            # Each process needs its own configuration file
+            env = dict(os.environ, ODOO_CONFIG=f"odoo.{db_name}.cfg")
+            commands[db_name] = cmd, env
+
+        utils.info(f"Updating {len(databases)} databases")
+        results = utils.run_parallel(commands, args.jobs)
+        print(utils.summary(results))
+        return 1 if any(code for code, _ in results.values()) else 0
+
+    def _finish_update(self, db_name, args, initialized, fingerprint):
+        """Set the passwords, the version and the fingerprint of the database"""
+        with self.env(db_name) as env:
+            # Set the user passwords if previously initialized
+            users = self.get("odoo", "users", default={})
+            if (initialized or args.passwords) and users:
+                utils.info("Setting user passwords")
+                model = env["res.users"]
+                for user, password in users.items():
+                    domain = [("login", "=", user)]
+                    model.search(domain).write({"password": password})
+
+            # Write the version into the database
+            utils.info("Setting database version")
+            version = self.get(base.SECTION, "version", default="0.0")
+            env["ir.config_parameter"].set_param("db_version", version)
+
+            # Only a complete update is reflected by the fingerprint
+            if fingerprint:
+                if args.listed or args.modules:
+                    fingerprint = ""
+                env["ir.config_parameter"].set_param(FINGERPRINT_KEY, fingerprint)
+
     def update(self, args=None):  # pylint: disable=R0915
         """Install/update Odoo modules"""
-        args, _ = load_update_arguments(args or [])
+        raw_args = args or []
+        args, _ = load_update_arguments(raw_args)
+
+        if args.all_databases:
+            return self._update_databases(args, raw_args)
+
+        if args.database:
+            self.set("odoo", "options", "db_name", value=args.database)
+
+        if args.plan:
+            print(self.plan(args))
+            return
 
         self.generate_config()
 
+        # Calculate the module checksums before loading anything of Odoo
+        index = self._checksum_index()
+        if not index and args.changed_closure:
+            index = ChecksumIndex()
+        checksums = index.checksums(self._get_module_paths()) if index else {}
+
+        fingerprint = self._fingerprint(index, checksums)
+        specific = args.all or args.listed or args.modules or args.passwords
+        if (
+            fingerprint
+            and not specific
+            and fingerprint == self._stored_fingerprint(self._db_name())
+        ):
+            utils.info("Nothing changed since the last update")
+            index.save()
+            return
+
         if not self._init_odoo():
             return
 
@@ -236,12 +845,17 @@ class ModuleEnvironment(env.Environment):
         if isinstance(db_name, list) and db_name:
             db_name = db_name[0]
 
-        with self._manage():
+        profiler = ModuleProfiler() if args.profile else nullcontext()
+        with self._manage(), profiler:
             # Ensure that the database is initialized
             db = odoo.sql_db.db_connect(db_name)
             initialized = False
             with closing(db.cursor()) as cr:
                 if not odoo.modules.db.is_initialized(cr):
+                    if not args.initialize:
+                        utils.error(f"Database {db_name} isn't initialized")
+                        return 1
+
                     utils.info("Initializing the database")
                     self.install_all(db_name, ["base"])
                     initialized = True
@@ -250,56 +864,34 @@ class ModuleEnvironment(env.Environment):
             self._run_migration(db_name, "pre_install")
 
             # Get the modules to install
-            if initialized:
-                uninstalled = self._get_modules()
-            else:
-                installed = self._get_installed_modules(db_name)
-                modules = self._get_modules()
-                if args.modules:
-                    modules.update(args.modules)
-
-                uninstalled = modules.difference(installed)
-
-            # Install all modules
-            if uninstalled:
-                utils.info("Installing all modules")
-                self.install_all(db_name, uninstalled)
-
-            # Check for auto install modules
-            self.check_auto_install(db_name)
-
-            # Execute the pre update script
-            self._run_migration(db_name, "pre_update")
+            uninstalled = self._get_uninstalled_modules(db_name, args, initialized)
 
-            # Update all modules which aren't installed before
-            if initialized:
-                self.update_checksums(db_name)
-            elif args.all or args.listed or args.modules:
-                self.update_specific(
-                    db_name,
-                    whitelist=args.modules,
-                    blacklist=uninstalled,
-                    installed=args.all,
-                    listed=args.listed,
+            changed = self._get_index_changes(
+                db_name, index, checksums, closure=args.changed_closure
+            )
+            translations = self._translation_cache(db_name)
+            with translations or nullcontext():
+                self._install_and_update(
+                    db_name, args, initialized, uninstalled, changed
                 )
-            else:
-                self.update_changed(db_name, uninstalled)
 
             # Execute the post update script
             self._run_migration(db_name, "post_update")
 
             # Finish everything
-            with self.env(db_name) as env:
-                # Set the user passwords if previously initialized
-                users = self.get("odoo", "users", default={})
-                if (initialized or args.passwords) and users:
-                    utils.info("Setting user passwords")
-                    model = env["res.users"]
-                    for user, password in users.items():
-                        domain = [("login", "=", user)]
-                        model.search(domain).write({"password": password})
-
-                # Write the version into the database
-                utils.info("Setting database version")
-                version = self.get(base.SECTION, "version", default="0.0")
-                env["ir.config_parameter"].set_param("db_version", version)
+            self._finish_update(db_name, args, initialized, fingerprint)
+
+            if translations:
+                self._store_translation_cache(db_name, translations)
+
+            if args.prewarm_assets:
+                self.prewarm_assets(db_name, args.asset_jobs)
+
+            if index:
+                # Partial updates leave other changed modules outdated
+                if not args.listed and not args.modules:
+                    self._store_checksums(db_name, checksums)
+                index.save()
+
+        if args.profile:
+            profiler.write(args.profile_prefix)
@@ -0,0 +1,127 @@
+# © 2026 initOS GmbH
+# License Apache-2.0 (http://www.apache.org/licenses/).
+
+import functools
+import time
+from collections import defaultdict
+
+from . import utils
+
+PHASES = ("python", "data", "translations", "schema")
+
+
+def _package_name(*args, **kwargs):
+    """Module name of the `package` argument of `load_data`"""
+    package = kwargs.get("package", args[-1] if args else None)
+    return getattr(package, "name", None)
+
+
+def _first_name(names):
+    names = list(names)
+    return names[0] if len(names) == 1 else None
+
+
+# Hooks into the module loading of Odoo given as module path, attribute path,
+# phase and a function to extract the module name from the arguments
+HOOKS = (
+    ("odoo.modules.loading", "load_openerp_module", "python", lambda n, *a, **k: n),
+    ("odoo.modules.loading", "load_data", "data", _package_name),
+    ("odoo.modules.loading", "load_demo", "data", _package_name),
+    (
+        "odoo.modules.registry",
+        "Registry.init_models",
+        "schema",
+        lambda self, cr, models, context, *a, **k: (context or {}).get("module"),
+    ),
+    (
+        "odoo.addons.base.models.ir_module",
+        "Module._load_module_terms",
+        "translations",
+        lambda self, modules, *a, **k: _first_name(modules),
+    ),
+    (
+        "odoo.addons.base.models.ir_module",
+        "Module._update_translations",
+        "translations",
+        lambda self, *a, **k: _first_name(self.mapped("name")),
+    ),
+)
+
+
+class ModuleProfiler:
+    """Record the time spent per module and loading phase while Odoo loads the
+    module graph. Nested hooks only count their exclusive time"""
+
+    def __init__(self):
+        self.timings = defaultdict(lambda: dict.fromkeys(PHASES, 0.0))
+        self.module = None
+        self._stack = []
+        self._patches = []
+
+    def _wrap(self, func, phase, get_module):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                module = get_module(*args, **kwargs)
+            except Exception:
+                module = None
+
+            self.module = module = module or self.module or "?"
+            frame = [time.perf_counter(), 0.0]
+            self._stack.append(frame)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._stack.pop()
+                elapsed = time.perf_counter() - frame[0]
+                self.timings[module][phase] += elapsed - frame[1]
+                if self._stack:
+                    self._stack[-1][1] += elapsed
+
+        return wrapper
+
+    def __enter__(self):
+        for module_name, attr, phase, get_module in HOOKS:
+            resolved = utils.resolve(module_name, attr)
+            if resolved and callable(resolved[2]):
+                obj, name, func = resolved
+                self._patches.append(resolved)
+                setattr(obj, name, self._wrap(func, phase, get_module))
+        return self
+
+    def __exit__(self, *exc):
+        while self._patches:
+            obj, name, func = self._patches.pop()
+            setattr(obj, name, func)
+
+    def report(self):
+        """Return a report of the modules sorted by the total time"""
+        rows = sorted(
+            self.timings.items(), key=lambda item: sum(item[1].values()), reverse=True
+        )
+        width = max([len("module")] + [len(name) for name, _ in rows])
+        header = [f"{'module':<{width}}", *(f"{p:>12}" for p in PHASES), "   total"]
+        lines = [" ".join(header)]
+        for name, phases in rows:
+            values = [f"{phases[p]:>12.3f}" for p in PHASES]
+            total = sum(phases.values())
+            lines.append(" ".join([f"{name:<{width}}", *values, f"{total:>8.3f}"]))
+        return "\n".join(lines)
+
+    def folded(self):
+        """Return the timings in the folded stack format used by flame graphs"""
+        lines = []
+        for name, phases in sorted(self.timings.items()):
+            for phase in PHASES:
+                micro = int(phases[phase] * 1e6)
+                if micro:
+                    lines.append(f"update;{name};{phase} {micro}")
+        return "\n".join(lines)
+
+    def write(self, prefix):
+        """Write the report and the flame graph trace"""
+        with open(f"{prefix}.txt", "w+", encoding="utf-8") as fp:
+            fp.write(self.report() + "\n")
+        with open(f"{prefix}.folded", "w+", encoding="utf-8") as fp:
+            fp.write(self.folded() + "\n")
+        utils.info(f"Wrote update profile to {prefix}.txt and {prefix}.folded")
@@ -2,7 +2,11 @@
 # License Apache-2.0 (http://www.apache.org/licenses/).
 
 import argparse
+import json
 import sys
+import time
+import traceback
+from contextlib import nullcontext
 
 from . import base, env, utils
 
@@ -18,8 +22,41 @@ def load_shell_arguments(args):
         default=utils.get_config_file(),
         help="Configuration file to use. Default: %(default)s",
     )
-    parser.add_argument("file", default=None, nargs="?", help="File to execute")
-    return parser.parse_known_args(args)
+    parser.add_argument(
+        "files",
+        default=[],
+        nargs="*",
+        metavar="file",
+        help="Files to execute. Multiple python files run one after another "
+        "within the same environment",
+    )
+    parser.add_argument(
+        "--stdin-jsonl",
+        action="store_true",
+        default=False,
+        help="Read the scripts from stdin as JSON lines with `script` or `code` "
+        "and optional `name` and `transaction`. The results are printed as JSON "
+        "lines",
+    )
+    parser.add_argument(
+        "--savepoint",
+        dest="transaction",
+        action="store_false",
+        default=True,
+        help="Run each script of a batch in a savepoint which is rolled back at "
+        "the end instead of committing it on success. The scripts must not commit",
+    )
+    args, left = parser.parse_known_args(args)
+
+    # Only leading python files are scripts. Everything else is passed to them
+    files = args.files
+    args.files = []
+    for i, name in enumerate(files):
+        if not name.endswith(".py") and i:
+            left = files[i:] + left
+            break
+        args.files.append(name)
+    return args, left
 
 
 def wrapped_console(script_file):
@@ -32,6 +69,76 @@ def wrapped_console(script_file):
     return console
 
 
+def load_batch_scripts(args, stdin=None):
+    """Return the scripts of a batch as dictionaries with name, code and
+    transaction"""
+    scripts = []
+    for name in args.files:
+        with open(name, encoding="utf-8") as fp:
+            scripts.append({"name": name, "code": fp.read()})
+
+    if args.stdin_jsonl:
+        for i, line in enumerate(stdin or sys.stdin, 1):
+            if not line.strip():
+                continue
+
+            script = json.loads(line)
+            if "script" in script:
+                with open(script["script"], encoding="utf-8") as fp:
+                    script.setdefault("code", fp.read())
+                script.setdefault("name", script["script"])
+            elif "code" not in script:
+                raise ValueError(f"Line {i}: Either `script` or `code` is required")
+            script.setdefault("name", f"<stdin:{i}>")
+            scripts.append(script)
+
+    for script in scripts:
+        script.setdefault("transaction", args.transaction)
+    return scripts
+
+
+def batch_console(scripts, results, report=None):
+    """Console running multiple scripts one after another within one environment.
+    Each script runs in its own transaction or in a savepoint"""
+
+    def console(local_vars):
+        env = local_vars.get("env")
+        for script in scripts:
+            name, transaction = script["name"], script["transaction"]
+            script_vars = dict(local_vars, __name__="__main__", __file__=name)
+            savepoint = env.cr.savepoint() if env and not transaction else None
+
+            start = time.perf_counter()
+            executed = False
+            try:
+                with savepoint or nullcontext():
+                    # pylint: disable=W0122
+                    exec(compile(script["code"], name, "exec"), script_vars)
+                    executed = True
+                code = 0
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else int(e.code is not None)
+            except Exception:
+                traceback.print_exc()
+                code = 1
+                if savepoint and executed:
+                    # Releasing the savepoint failed because the script committed.
+                    # Recover from the aborted transaction for the next scripts
+                    env.cr.rollback()
+
+            if env and transaction:
+                if code:
+                    env.cr.rollback()
+                else:
+                    env.cr.commit()
+
+            results[name] = code, time.perf_counter() - start
+            if report:
+                report(name, *results[name])
+
+    return console
+
+
 class RunEnvironment(env.Environment):
     """Class to the environment"""
 
@@ -41,17 +148,47 @@ class RunEnvironment(env.Environment):
         if not self._init_odoo():
             return False
 
+        if len(args.files) > 1 or args.stdin_jsonl:
+            return self.shell_batch(args, left)
+
         # pylint: disable=C0415,E0401
         from odoo.cli.shell import Shell
 
-        sys.argv = [args.file] + left if args.file else [""]
+        file = args.files[0] if args.files else None
+        sys.argv = [file] + left if file else [""]
         shell = Shell()
 
-        if args.file:
-            shell.console = wrapped_console(args.file)
+        if file:
+            shell.console = wrapped_console(file)
 
         return shell.run(["-c", base.ODOO_CONFIG, "--no-http"])
 
+    def shell_batch(self, args, left):
+        """Run multiple scripts within one Odoo shell"""
+        # pylint: disable=C0415,E0401
+        from odoo.cli.shell import Shell
+
+        scripts = load_batch_scripts(args)
+        results = {}
+
+        def report(name, code, duration):
+            if args.stdin_jsonl:
+                result = {"name": name, "exit": code, "duration": round(duration, 3)}
+                print(json.dumps(result), flush=True)
+            elif code:
+                utils.error(f"{name} failed after {duration:.2f}s")
+            else:
+                utils.info(f"{name} finished in {duration:.2f}s")
+
+        sys.argv = [""] + left
+        shell = Shell()
+        shell.console = batch_console(scripts, results, report)
+        shell.run(["-c", base.ODOO_CONFIG, "--no-http"])
+
+        if not args.stdin_jsonl:
+            print(utils.summary(results))
+        return 1 if any(code for code, _ in results.values()) else 0
+
     def populate(self, args=None):
         if not args:
             args = []
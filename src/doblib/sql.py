@@ -0,0 +1,176 @@
+# © 2026 initOS GmbH
+# License Apache-2.0 (http://www.apache.org/licenses/).
+
+import re
+import time
+
+from . import utils
+
+# Characters which might change the state of the parser
+SPECIAL = re.compile(r"""[-/'"$;]""")
+DOLLAR = re.compile(r"\$([A-Za-z_]\w*)?\$")
+COPY_STDIN = re.compile(r"COPY\b.*\bFROM\s+STDIN\b", re.IGNORECASE | re.DOTALL)
+# Comment line to commit the transaction at this point of the script
+COMMIT_MARKER = re.compile(r"\s*--\s*dob:\s*commit\s*$", re.IGNORECASE)
+COMMIT = object()
+
+
+class CopyData:
+    """File-like object streaming the data of a `COPY ... FROM STDIN` block until
+    the terminating `\\.` line"""
+
+    def __init__(self, lines):
+        self._lines = lines
+        self.done = False
+
+    def readline(self, size=-1):
+        if self.done:
+            return ""
+
+        line = next(self._lines, "")
+        if not line or line.rstrip("\r\n") == "\\.":
+            self.done = True
+            return ""
+        return line
+
+    def read(self, size=-1):
+        return self.readline()
+
+    def drain(self):
+        """Skip the remaining data"""
+        while self.readline():
+            pass
+
+
+def _is_ident(char):
+    return char.isalnum() or char == "_"
+
+
+def split_statements(lines):  # noqa: C901
+    """Split an SQL script given as iterable of lines into statements without
+    loading it completely. Quotes, dollar quotes and comments are respected.
+    Yields tuples of the statement and the `CopyData` of `COPY ... FROM STDIN`
+    statements. Commit markers are yielded as `COMMIT` statement"""
+    lines = iter(lines)
+    buf, content, state, depth, escape = [], False, None, 0, False
+
+    for line in lines:
+        if state is None and not content and COMMIT_MARKER.match(line):
+            buf = []
+            yield COMMIT, None
+            continue
+
+        start, i, n = 0, 0, len(line)
+        while i < n:
+            if state == "/*":
+                if line.startswith("*/", i):
+                    depth, i = depth - 1, i + 2
+                    state = state if depth else None
+                elif line.startswith("/*", i):
+                    depth, i = depth + 1, i + 2
+                else:
+                    i += 1
+                continue
+
+            if state == "'":
+                pos = line.find("'", i)
+                backslash = line.find("\\", i) if escape else -1
+                if backslash >= 0 and (pos < 0 or backslash < pos):
+                    i = backslash + 2
+                elif pos < 0:
+                    break
+                elif line.startswith("''", pos):
+                    i = pos + 2
+                else:
+                    state, i = None, pos + 1
+                continue
+
+            if state is not None:
+                # Double quoted identifiers and dollar quoted strings
+                pos = line.find(state, i)
+                if pos < 0:
+                    break
+                state, i = None, pos + len(state)
+                continue
+
+            match = SPECIAL.search(line, i)
+            end = match.start() if match else n
+            segment = line[i:end]
+            if not content and segment.strip():
+                # Drop leading whitespaces and comments of the statement
+                buf, start = [], i + len(segment) - len(segment.lstrip())
+                content = True
+
+            if not match or line.startswith("--", end):
+                break
+
+            i, char = end, line[end]
+            if line.startswith("/*", i):
+                state, depth, i = "/*", 1, i + 2
+                continue
+
+            if not content and char != ";":
+                buf, start, content = [], i, True
+
+            if char == "'":
+                escape = i > 0 and line[i - 1] in "eE"
+                escape = escape and (i < 2 or not _is_ident(line[i - 2]))
+                state = "'"
+            elif char == '"':
+                state = '"'
+            elif char == "$":
+                dollar = DOLLAR.match(line, i)
+                if dollar and not (i > 0 and _is_ident(line[i - 1])):
+                    state, i = dollar.group(0), dollar.end()
+                    continue
+            elif char == ";":
+                buf.append(line[start : i + 1])
+                statement = "".join(buf).strip()
+                buf, start = [], i + 1
+                if content:
+                    content = False
+                    if COPY_STDIN.match(statement):
+                        data = CopyData(lines)
+                        yield statement, data
+                        data.drain()
+                        break
+                    yield statement, None
+            i += 1
+
+        buf.append(line[start:])
+
+    statement = "".join(buf).strip()
+    if content and statement:
+        yield statement, None
+
+
+def execute_script(cr, lines, slow=1.0):
+    """Execute the statements of an SQL script one by one and report slow
+    statements and the total time. Scripts using commit markers are committed
+    at the end too because closing the cursor would discard the last part"""
+    count, total, committed = 0, 0.0, None
+    for statement, data in split_statements(lines):
+        if statement is COMMIT:
+            cr.commit()
+            committed = count
+            utils.info(f"Committed after {count} statements")
+            continue
+
+        start = time.perf_counter()
+        if data is None:
+            cr.execute(statement)
+        else:
+            cr.copy_expert(statement, data)
+
+        elapsed = time.perf_counter() - start
+        count, total = count + 1, total + elapsed
+        if elapsed >= slow:
+            short = " ".join(statement.split())[:60]
+            utils.info(f"Statement {count} took {elapsed:.2f}s: {short}")
+
+    if committed is not None and committed < count:
+        cr.commit()
+        utils.info(f"Committed after {count} statements")
+
+    utils.info(f"Executed {count} statements in {total:.2f}s")
+    return count
@@ -0,0 +1,105 @@
+# © 2026 initOS GmbH
+# License Apache-2.0 (http://www.apache.org/licenses/).
+
+import functools
+
+from . import utils
+
+TABLE = "dob_translation_checksum"
+# Pseudo module to store the languages the translations were loaded for
+LANGUAGES = "__languages__"
+
+# Methods of Odoo loading the translations of modules
+HOOKS = (
+    ("odoo.addons.base.models.ir_module", "Module._load_module_terms"),
+    ("odoo.addons.base.models.ir_module", "Module._update_translations"),
+)
+
+
+class TranslationCache:
+    """Skip the loading of translations of modules whose PO files didn't change
+    since they were loaded into the database the last time"""
+
+    def __init__(self, checksums, languages=None):
+        self.checksums = checksums
+        self.languages = ",".join(sorted(set(languages or [])))
+        self.stored = {}
+        self.loaded = set()
+        self.skipped = set()
+        self.active = False
+        self._patches = []
+
+    def read(self, cr):
+        """Read the stored checksums from the database"""
+        cr.execute(
+            f"CREATE TABLE IF NOT EXISTS {TABLE} "
+            "(module VARCHAR PRIMARY KEY, checksum VARCHAR NOT NULL)"
+        )
+        cr.execute(f"SELECT module, checksum FROM {TABLE}")
+        self.stored = dict(cr.fetchall())
+        # New languages require the translations of all modules
+        self.active = self.stored.get(LANGUAGES) == self.languages
+        return self
+
+    def store(self, cr):
+        """Store the checksums of the modules whose translations were loaded"""
+        rows = [(name, self.checksums[name]) for name in sorted(self.loaded)]
+        rows.append((LANGUAGES, self.languages))
+        for name, checksum in rows:
+            cr.execute(
+                f"INSERT INTO {TABLE} (module, checksum) VALUES (%s, %s) "
+                "ON CONFLICT (module) DO UPDATE SET checksum = EXCLUDED.checksum",
+                (name, checksum),
+            )
+
+    def changed(self, name):
+        """Check if the translations of the module must be loaded"""
+        checksum = self.checksums.get(name)
+        return not self.active or not checksum or checksum != self.stored.get(name)
+
+    def _filter(self, names):
+        names = list(names)
+        result = [name for name in names if self.changed(name)]
+        self.skipped.update(set(names).difference(result))
+        self.loaded.update(name for name in result if name in self.checksums)
+        return result
+
+    def _wrap_load_module_terms(self, func):
+        @functools.wraps(func)
+        def wrapper(model, modules, *args, **kwargs):
+            modules = self._filter(modules)
+            if not modules:
+                return None
+            return func(model, modules, *args, **kwargs)
+
+        return wrapper
+
+    def _wrap_update_translations(self, func):
+        @functools.wraps(func)
+        def wrapper(records, *args, **kwargs):
+            names = set(self._filter(records.mapped("name")))
+            records = records.filtered(lambda rec: rec.name in names)
+            if not records:
+                return None
+            return func(records, *args, **kwargs)
+
+        return wrapper
+
+    def __enter__(self):
+        for module_name, attr in HOOKS:
+            resolved = utils.resolve(module_name, attr)
+            if resolved and callable(resolved[2]):
+                obj, name, func = resolved
+                wrap = getattr(self, f"_wrap{name}")
+                self._patches.append(resolved)
+                setattr(obj, name, wrap(func))
+        return self
+
+    def __exit__(self, *exc):
+        while self._patches:
+            obj, name, func = self._patches.pop()
+            setattr(obj, name, func)
+
+        skipped = self.skipped.difference(self.loaded)
+        if skipped:
+            utils.info(f"Skipped unchanged translations of {len(skipped)} modules")
@@ -2,9 +2,17 @@
 # License Apache-2.0 (http://www.apache.org/licenses/).
 
 import argparse
+import fcntl
+import importlib
+import json
 import logging
 import os
-from fnmatch import fnmatch
+import re
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from fnmatch import translate
 from subprocess import PIPE, Popen
 
 _logger = logging.getLogger(__name__)
@@ -48,24 +56,58 @@ def error(msg, *args):
     _logger.error(f"\x1b[31m{msg % args}\x1b[0m")
 
 
-def check_filters(name, whitelist=None, blacklist=None):
-    """Check the name against the whitelist and blacklist"""
+class FilterMatcher:
+    """Black-/whitelist compiled once to check many names. Patterns without
+    wildcards are looked up directly and the most specific pattern wins"""
 
-    def matches(patterns):
-        return [len(pat.replace("*", "")) for pat in patterns if fnmatch(name, pat)]
+    def __init__(self, whitelist=None, blacklist=None):
+        self.empty = not whitelist and not blacklist
+        self.whitelist = self._compile(whitelist or [])
+        self.blacklist = self._compile(blacklist or [])
 
-    # Per default everything is allowed
-    if not whitelist and not blacklist:
-        return True
-
-    whitelist_matches = matches(whitelist or [])
-    blacklist_matches = matches(blacklist or [])
+    def _compile(self, patterns):
+        exact, wildcards = {}, []
+        for pat in set(patterns):
+            specificity = len(pat.replace("*", ""))
+            if any(c in pat for c in "*?["):
+                regex = re.compile(translate(os.path.normcase(pat)))
+                wildcards.append((specificity, regex.match))
+            else:
+                exact[os.path.normcase(pat)] = specificity
+
+        # Check the most specific patterns first to stop at the first match
+        wildcards.sort(key=lambda x: x[0], reverse=True)
+        return exact, wildcards
+
+    def _specificity(self, name, compiled):
+        """Return the specificity of the best matching pattern or -1"""
+        exact, wildcards = compiled
+        best = exact.get(name, -1)
+        for specificity, match in wildcards:
+            if specificity <= best:
+                break
+            if match(name):
+                return specificity
+        return best
+
+    def __call__(self, name):
+        # Per default everything is allowed
+        if self.empty:
+            return True
+
+        name = os.path.normcase(name)
+        white = self._specificity(name, self.whitelist)
+        black = self._specificity(name, self.blacklist)
+        if white >= 0 and black >= 0:
+            # The most specific pattern wins
+            return white > black
+
+        return black < 0
 
-    if whitelist_matches and blacklist_matches:
-        # The most specific pattern wins
-        return max(whitelist_matches) > max(blacklist_matches)
 
-    return not blacklist_matches
+def check_filters(name, whitelist=None, blacklist=None):
+    """Check the name against the whitelist and blacklist"""
+    return FilterMatcher(whitelist, blacklist)(name)
 
 
 def default_parser(command):
@@ -110,6 +152,164 @@ def merge(a, b, *, replace=None):
     return b
 
 
+def read_json(path, default=None):
+    """Read a JSON file and return the default if missing or invalid"""
+    try:
+        with open(path, encoding="utf-8") as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json(path, data):
+    """Write a JSON file atomically"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w+", encoding="utf-8") as fp:
+        json.dump(data, fp)
+    os.replace(tmp, path)
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on a lock file next to the path"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.lock", "a+", encoding="utf-8") as fp:
+        fcntl.flock(fp, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fp, fcntl.LOCK_UN)
+
+
+def run_parallel(commands, jobs=1, log_dir=None):
+    """Run the commands given as mapping of a name to a tuple of the command, the
+    environment and optionally the working directory in parallel processes. The
+    output of each process is printed prefixed with the name once it's finished
+    and written to a log file per name if log_dir is set. Returns a mapping of
+    the names to the return code and duration"""
+
+    def run(name, cmd, env, cwd=None):
+        start = time.perf_counter()
+        try:
+            proc = subprocess.run(
+                cmd,
+                env=env,
+                cwd=cwd,
+                stdout=PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                check=False,
+            )
+        except (OSError, ValueError) as e:
+            # Report a process which can't be started as failure
+            return name, 1, time.perf_counter() - start, f"{e}\n"
+        return name, proc.returncode, time.perf_counter() - start, proc.stdout
+
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        futures = [executor.submit(run, name, *cmd) for name, cmd in commands.items()]
+        for future in as_completed(futures):
+            name, returncode, duration, output = future.result()
+            for line in (output or "").splitlines():
+                print(f"[{name}] {line}")
+
+            if log_dir:
+                log_name = re.sub(r"[^\w.-]+", "_", name).strip("_") or "log"
+                with open(f"{log_dir}/{log_name}.log", "w+", encoding="utf-8") as fp:
+                    fp.write(output or "")
+            results[name] = (returncode, duration)
+    return results
+
+
+def summary(results):
+    """Format the results of `run_parallel` as table"""
+    width = max([len("name")] + [len(name) for name in results])
+    lines = [f"{'name':<{width}}  status  duration"]
+    for name, (returncode, duration) in sorted(results.items()):
+        status = "ok" if not returncode else f"failed ({returncode})"
+        lines.append(f"{name:<{width}}  {status:<6}  {duration:>7.1f}s")
+    return "\n".join(lines)
+
+
+def resolve(module_name, attr):
+    """Resolve a dotted attribute of a module and return the owning object, the
+    name of the attribute and the value or None if not found"""
+    try:
+        obj = importlib.import_module(module_name)
+    except ImportError:
+        return None
+
+    *path, name = attr.split(".")
+    for part in path:
+        obj = getattr(obj, part, None)
+
+    func = getattr(obj, name, None)
+    if func is None:
+        return None
+    return obj, name, func
+
+
+def _read_cgroup(root, *names):
+    """Return the stripped content of the first readable cgroup file"""
+    for name in names:
+        try:
+            with open(os.path.join(root, name), encoding="utf-8") as fp:
+                return fp.read().strip()
+        except OSError:
+            continue
+    return None
+
+
+def available_cpus(root="/sys/fs/cgroup"):
+    """Return the number of usable CPUs respecting affinity and cgroup quotas"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    # cgroup v2 uses "quota period" and v1 separate files
+    quota = _read_cgroup(root, "cpu.max")
+    if quota:
+        quota, _, period = quota.partition(" ")
+    else:
+        quota = _read_cgroup(root, "cpu/cpu.cfs_quota_us", "cpu.cfs_quota_us")
+        period = _read_cgroup(root, "cpu/cpu.cfs_period_us", "cpu.cfs_period_us")
+
+    try:
+        quota, period = int(quota), int(period)
+    except (TypeError, ValueError):
+        return cpus
+
+    if quota > 0 and period > 0:
+        cpus = min(cpus, max(1, -(-quota // period)))
+    return cpus
+
+
+def available_memory(root="/sys/fs/cgroup"):
+    """Return the usable memory in bytes respecting cgroup limits"""
+    try:
+        memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        memory = None
+
+    limit = _read_cgroup(
+        root, "memory.max", "memory/memory.limit_in_bytes", "memory.limit_in_bytes"
+    )
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        return memory
+
+    # Unlimited cgroups v1 report a huge number
+    if memory is None or 0 < limit < memory:
+        return limit
+    return memory
+
+
 def raise_keyboard_interrupt(*a):
     raise KeyboardInterrupt()
 
@@ -123,10 +323,15 @@ def config_logger(log_level=logging.INFO):
     )
     handler = logging.StreamHandler()
     handler.setFormatter(formatter)
+    handler.dob = True
 
     # pylint: disable=E1101
     for name, logger in logging.root.manager.loggerDict.items():
         if any(name.startswith(x) for x in ("doblib.", "git_aggregator.")):
+            # Replace the handlers of previous calls
+            for old in [h for h in logger.handlers if getattr(h, "dob", False)]:
+                logger.removeHandler(old)
+
             logger.propagate = False
             logger.addHandler(handler)
             logger.setLevel(log_level)
@@ -0,0 +1,15 @@
+# © 2026 initOS GmbH
+# License Apache-2.0 (http://www.apache.org/licenses/).
+
+import pytest
+
+from doblib import base
+
+
+@pytest.fixture(autouse=True)
+def cache_path(tmp_path, monkeypatch):
+    """Keep the caches of every test in a temporary directory"""
+    path = str(tmp_path / "dob")
+    monkeypatch.setattr(base, "CACHE_PATH", path)
+    monkeypatch.setenv("DOB_CACHE", path)
+    return path
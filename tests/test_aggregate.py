@@ -2,19 +2,15 @@
 # License Apache-2.0 (http://www.apache.org/licenses/).
 
 import os
-from queue import Empty
+from tempfile import TemporaryDirectory
 from unittest import mock
 
 import pytest
+from test_mirror import create_upstream, repo_dict
 
+from doblib import utils
 from doblib.aggregate import AggregateEnvironment, aggregate_repo
-
-
-def aggregate_exception(repo, args, sem, err_queue):
-    try:
-        err_queue.put_nowait("ERROR")
-    finally:
-        sem.release()
+from doblib.mirror import git
 
 
 @pytest.fixture
@@ -50,59 +46,100 @@ def test_aggregate(env):
 @mock.patch("doblib.aggregate.match_dir", return_value=False)
 def test_aggregate_repo(match_mock):
     m = mock.MagicMock()
-    aggregate_repo(m, m, m, m)
+    assert not aggregate_repo(m, m)
 
-    m.put_nowait.assert_not_called()
-    m.release.assert_called_once()
     match_mock.assert_called_once_with(m.cwd, m.dirmatch)
     m.aggregate.assert_not_called()
 
     m.reset_mock()
     match_mock.return_value = True
-    aggregate_repo(m, m, m, m)
-
-    m.put_nowait.assert_not_called()
-    m.release.assert_called_once()
+    assert aggregate_repo(m, m)
     m.aggregate.assert_called()
 
-    aggregate_repo(m, m, m, m, mode="show-all-prs")
+    aggregate_repo(m, m, mode="show-all-prs")
     m.show_all_prs.assert_called_once()
-    aggregate_repo(m, m, m, m, mode="show-closed-prs")
+    aggregate_repo(m, m, mode="show-closed-prs")
     m.show_closed_prs.assert_called_once()
 
-    m.reset_mock()
-    match_mock.side_effect = Exception()
-    aggregate_repo(m, m, m, m)
+    match_mock.side_effect = ValueError()
+    with pytest.raises(ValueError):
+        aggregate_repo(m, m)
 
-    m.put_nowait.assert_called()
-    m.release.assert_called_once()
-    m.aggregate.assert_not_called()
+
+def test_schedule(env):
+    repos = [{"cwd": "a"}, {"cwd": "b"}, {"cwd": "c"}, {"cwd": "d"}]
+    durations = {"a": 1.0, "b": 30.0, "d": 5.0}
+    result = [repo["cwd"] for repo in env._schedule(repos, durations)]
+    assert result == ["c", "b", "d", "a"]
 
 
-@mock.patch("doblib.aggregate.traceback")
 @mock.patch("doblib.aggregate.Repo")
-@mock.patch("doblib.aggregate.aggregate_repo")
-@mock.patch("doblib.aggregate.get_repos", return_value=[{"cwd": "unknown"}])
-def test_bootstrap(repos, aggregate, repo, traceback, env):
+@mock.patch("doblib.aggregate.aggregate_repo", return_value=True)
+@mock.patch("doblib.aggregate.get_repos")
+def test_bootstrap(repos, aggregate, repo, env):
     env.generate_config = mock.MagicMock()
-
-    assert not env.init()
-
-    repos.assert_called_once()
-    repo.assert_called()
-    aggregate.assert_called()
-
-    aggregate.reset_mock()
-    env.init(["-j", "1"])
-    aggregate.assert_called()
-
-    with mock.patch("doblib.aggregate.Queue") as m:
-        queue = m.return_value
-        queue.empty.return_value = False
-
-        queue.get_nowait.side_effect = [(1, 42, 37), Empty()]
-        assert env.init() == 1
-
-        queue.empty.assert_called()
-        queue.get_nowait.assert_called()
-        traceback.print_exception.assert_called_once_with(1, 42, 37)
+    env._check_repo = mock.MagicMock(return_value=({}, False))
+    repos.return_value = [{"cwd": "small"}, {"cwd": "large"}]
+
+    with TemporaryDirectory() as dir_name:
+        with mock.patch("doblib.base.CACHE_PATH", dir_name):
+            path = os.path.join(dir_name, "aggregate.json")
+            utils.write_json(path, {"small": 1.0, "large": 100.0})
+
+            assert not env.init(["-j", "1"])
+            repos.assert_called_once()
+            # The longest running repo is aggregated first
+            assert [c.kwargs["cwd"] for c in repo.call_args_list] == ["large", "small"]
+            assert set(utils.read_json(path)) == {"small", "large"}
+
+            # Show PRs without recording durations
+            utils.write_json(path, {})
+            assert not env.aggregate("show-all-prs")
+            assert utils.read_json(path) == {}
+
+            # Fail fast and cancel the remaining repos
+            aggregate.reset_mock()
+            aggregate.side_effect = Exception("failed")
+            assert env.init(["-j", "1"]) == 1
+            aggregate.assert_called_once()
+
+
+def test_incremental_init(env):
+    with TemporaryDirectory() as dir_name:
+        upstream = f"{dir_name}/upstream"
+        create_upstream(upstream)
+        repos = [repo_dict(f"{dir_name}/repo", upstream)]
+
+        with mock.patch("doblib.base.CACHE_PATH", dir_name):
+            with mock.patch("doblib.aggregate.get_repos", return_value=repos):
+                with mock.patch(
+                    "doblib.aggregate.aggregate_repo", wraps=aggregate_repo
+                ) as aggregate:
+                    assert not env.init(["--no-config"])
+                    aggregate.assert_called_once()
+
+                    head = git("rev-parse", "HEAD", cwd=upstream).strip()
+                    state = env._repo_state(f"{dir_name}/repo")
+                    assert state["inputs"] == [head]
+                    assert state["head"] == head
+
+                    # Nothing changed
+                    aggregate.reset_mock()
+                    assert not env.init(["--no-config"])
+                    aggregate.assert_not_called()
+
+                    # Forced by the option
+                    assert not env.init(["--no-config", "--full"])
+                    aggregate.assert_called_once()
+
+                    # New commit in the upstream
+                    aggregate.reset_mock()
+                    git("commit", "--quiet", "--allow-empty", "-m", "2", cwd=upstream)
+                    assert not env.init(["--no-config"])
+                    aggregate.assert_called_once()
+
+                    # Changed configuration
+                    aggregate.reset_mock()
+                    repos[0]["shell_command_after"] = ["true"]
+                    assert not env.init(["--no-config"])
+                    aggregate.assert_called_once()
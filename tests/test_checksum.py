@@ -0,0 +1,128 @@
+# © 2026 initOS GmbH
+# License Apache-2.0 (http://www.apache.org/licenses/).
+
+import os
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from doblib.checksum import (
+    TABLE,
+    ChecksumIndex,
+    changed_modules,
+    file_hash,
+    read_checksums,
+    store_checksums,
+)
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w+", encoding="utf-8") as fp:
+        fp.write(content)
+
+
+def test_file_hash():
+    with TemporaryDirectory() as dir_name:
+        write(f"{dir_name}/a", "abc")
+        assert file_hash(f"{dir_name}/a") == (
+            "a9993e364706816aba3e25717850c26c9cd0d89d"
+        )
+
+
+def test_module_checksum():
+    with TemporaryDirectory() as dir_name:
+        index = ChecksumIndex(f"{dir_name}/index.json")
+        write(f"{dir_name}/mod/__manifest__.py", "{}")
+        write(f"{dir_name}/mod/models.py", "")
+
+        checksum = index.module_checksum(f"{dir_name}/mod")
+        assert checksum == index.module_checksum(f"{dir_name}/mod")
+
+        # Excluded files don't influence the checksum
+        write(f"{dir_name}/mod/static/src/js/file.js", "")
+        write(f"{dir_name}/mod/tests/test_mod.py", "")
+        write(f"{dir_name}/mod/i18n/mod.pot", "")
+        write(f"{dir_name}/mod/.hidden", "")
+        assert checksum == index.module_checksum(f"{dir_name}/mod")
+
+        write(f"{dir_name}/mod/i18n/de.po", "")
+        assert checksum != index.module_checksum(f"{dir_name}/mod")
+
+
+def test_cached_hashes():
+    with TemporaryDirectory() as dir_name:
+        index = ChecksumIndex(f"{dir_name}/index.json")
+        write(f"{dir_name}/mod/__manifest__.py", "{}")
+        index.checksums({"mod": f"{dir_name}/mod"})
+
+        # Unchanged files aren't hashed again
+        with mock.patch("doblib.checksum.file_hash", return_value="") as hash_mock:
+            index.checksums({"mod": f"{dir_name}/mod"})
+            hash_mock.assert_not_called()
+
+            stat = os.stat(f"{dir_name}/mod/__manifest__.py")
+            os.utime(
+                f"{dir_name}/mod/__manifest__.py",
+                ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000),
+            )
+            index.checksums({"mod": f"{dir_name}/mod"})
+            hash_mock.assert_called_once()
+
+
+def test_changed():
+    with TemporaryDirectory() as dir_name:
+        index = ChecksumIndex(f"{dir_name}/cache/index.json")
+        write(f"{dir_name}/a/__manifest__.py", "{}")
+        write(f"{dir_name}/b/__manifest__.py", "{}")
+
+        modules = {"a": f"{dir_name}/a", "b": f"{dir_name}/b"}
+        checksums = index.checksums(modules)
+        assert changed_modules(None, checksums) is None
+        assert changed_modules(checksums, index.checksums(modules)) == set()
+
+        write(f"{dir_name}/b/__manifest__.py", "{'name': 'b'}")
+        write(f"{dir_name}/c/__manifest__.py", "{}")
+        modules["c"] = f"{dir_name}/c"
+        assert changed_modules(checksums, index.checksums(modules)) == {"b", "c"}
+
+
+def test_stored_checksums():
+    cr = mock.MagicMock()
+    cr.fetchone.return_value = (None,)
+    assert read_checksums(cr) is None
+
+    cr.fetchone.return_value = (TABLE,)
+    cr.fetchall.return_value = [("a", "1")]
+    assert read_checksums(cr) == {"a": "1"}
+
+    cr.reset_mock()
+    store_checksums(cr, {"b": "2", "a": "1"})
+    queries = [c.args for c in cr.execute.call_args_list]
+    assert queries[1] == (f"DELETE FROM {TABLE}",)
+    assert [q[1] for q in queries[2:]] == [("a", "1"), ("b", "2")]
+
+
+def test_invalid_index():
+    with TemporaryDirectory() as dir_name:
+        write(f"{dir_name}/index.json", "invalid")
+        index = ChecksumIndex(f"{dir_name}/index.json")
+        assert index.files == {}
+
+
+def test_translation_checksum():
+    with TemporaryDirectory() as dir_name:
+        path = f"{dir_name}/module"
+        os.makedirs(path)
+        index = ChecksumIndex(f"{dir_name}/index.json")
+        empty = index.translation_checksum(path)
+
+        write(f"{path}/i18n/module.pot", "template")
+        write(f"{path}/__init__.py", "")
+        assert index.translation_checksum(path) == empty
+
+        write(f"{path}/i18n/de.po", "translation")
+        checksum = index.translation_checksum(path)
+        assert checksum != empty
+
+        write(f"{path}/i18n/de.po", "changed translation")
+        assert index.translation_checksum(path) != checksum
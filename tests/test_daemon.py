@@ -0,0 +1,180 @@
+# © 2026 initOS GmbH
+# License Apache-2.0 (http://www.apache.org/licenses/).
+
+import io
+import json
+import os
+import socket
+import sys
+import threading
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+import pytest
+
+from doblib import env as dob_env
+from doblib.daemon import DaemonEnvironment, forward, send
+
+
+@pytest.fixture
+def env():
+    cur = os.getcwd()
+    os.chdir("tests/environment/")
+    env = DaemonEnvironment("odoo.local.yaml")
+    os.chdir(cur)
+    return env
+
+
+def read_messages(conn):
+    with conn.makefile("r", encoding="utf-8") as fp:
+        return [json.loads(line) for line in fp]
+
+
+def test_forward(capsys):
+    with TemporaryDirectory() as dir_name:
+        path = f"{dir_name}/daemon.sock"
+        assert forward(["u"], "u", path) is None
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(path)
+        server.listen()
+        requests = []
+
+        def serve(*messages):
+            conn, _ = server.accept()
+            with conn, conn.makefile("r", encoding="utf-8") as fp:
+                requests.append(json.loads(fp.readline()))
+                for message in messages:
+                    send(conn, message)
+
+        thread = threading.Thread(
+            target=serve, args=({"out": "hello\n"}, {"err": "warn\n"}, {"exit": 3})
+        )
+        thread.start()
+        assert forward(["u", "--all"], "u", path, cfg="odoo.yaml") == 3
+        thread.join()
+
+        assert requests[0]["args"] == ["u", "--all"]
+        assert requests[0]["config"] == os.path.abspath("odoo.yaml")
+        assert requests[0]["cwd"] == os.getcwd()
+        captured = capsys.readouterr()
+        assert captured.out == "hello\n"
+        assert captured.err == "warn\n"
+
+        thread = threading.Thread(target=serve, args=({"stale": "outdated"},))
+        thread.start()
+        assert forward(["u"], "u", path) is None
+        thread.join()
+
+        with mock.patch.dict(os.environ, {"DOB_NO_DAEMON": "1"}):
+            assert forward(["u"], "u", path) is None
+        server.close()
+
+
+def test_forward_stdin():
+    with TemporaryDirectory() as dir_name:
+        path = f"{dir_name}/daemon.sock"
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(path)
+        server.listen()
+        received = []
+
+        def serve(accept):
+            conn, _ = server.accept()
+            with conn, conn.makefile("r", encoding="utf-8") as fp:
+                assert json.loads(fp.readline())["stdin"]
+                if not accept:
+                    send(conn, {"stale": "outdated"})
+                    return
+
+                send(conn, {"accept": True})
+                received.append(json.loads(fp.readline())["stdin"])
+                send(conn, {"exit": 0})
+
+        stdin = io.StringIO("print(1)\n")
+        with mock.patch("sys.stdin", stdin):
+            # The input stays for the local run if the daemon refuses
+            thread = threading.Thread(target=serve, args=(False,))
+            thread.start()
+            assert forward(["s"], "s", path) is None
+            thread.join()
+            assert stdin.read() == "print(1)\n"
+
+            stdin.seek(0)
+            thread = threading.Thread(target=serve, args=(True,))
+            thread.start()
+            assert forward(["s"], "s", path) == 0
+            thread.join()
+            assert received == ["print(1)\n"]
+
+        # Unreachable daemon with a leftover socket file
+        server.close()
+        stdin.seek(0)
+        with mock.patch("sys.stdin", stdin):
+            assert forward(["s"], "s", path) is None
+        assert stdin.read() == "print(1)\n"
+
+
+def test_handle(env):
+    env._module_checksums = mock.MagicMock(return_value={"a": "1"})
+    request = {
+        "args": ["u"],
+        "cwd": os.getcwd(),
+        "config": os.path.abspath(env._cfg),
+        "environment": dob_env.config_environment(),
+    }
+
+    def handle(request, *messages):
+        server, client = socket.socketpair()
+        with server, client:
+            for message in (request, *messages):
+                send(client, message)
+            reason = env._handle(server, {"a": "1"})
+            server.close()
+            return reason, read_messages(client)
+
+    def fake_main(args):
+        print("updated", args)
+        sys.exit(2)
+
+    with mock.patch("doblib.__main__.main", side_effect=fake_main):
+        reason, messages = handle(request)
+    assert reason is None
+    assert "".join(m.get("out", "") for m in messages) == "updated ['u']\n"
+    assert messages[0] == {"accept": True}
+    assert messages[-1] == {"exit": 2}
+
+    # The input follows the accepted request
+    def fake_shell(args):
+        print(sys.stdin.read())
+
+    with mock.patch("doblib.__main__.main", side_effect=fake_shell):
+        reason, messages = handle(dict(request, stdin=True), {"stdin": "code"})
+    assert "".join(m.get("out", "") for m in messages) == "code\n"
+
+    reason, messages = handle(dict(request, cwd="/"))
+    assert reason is None
+    assert "stale" in messages[0]
+
+    reason, messages = handle(dict(request, config="/other/odoo.yaml"))
+    assert reason is None
+    assert messages == [{"stale": "Different configuration file"}]
+
+    env._module_checksums.return_value = {"a": "2"}
+    reason, messages = handle(request)
+    assert reason == "Modules changed"
+    assert messages == [{"stale": "Modules changed"}]
+
+
+@mock.patch("os.execv")
+def test_daemon(execv, env):
+    env._init_odoo = mock.MagicMock(return_value=False)
+    assert env.daemon([]) == 1
+
+    env._init_odoo.return_value = True
+    env._preload = mock.MagicMock()
+    env.serve = mock.MagicMock(return_value="Modules changed")
+    env.daemon(["--socket", "/tmp/dob.sock"])
+    env.serve.assert_called_once_with("/tmp/dob.sock")
+    execv.assert_called_once()
+    assert os.environ.pop("DOB_NO_DAEMON") == "1"
@@ -157,3 +157,264 @@ def test_link_modules(env):
         repo["modules"] = ["!abc"]
         env._link_modules()
         assert not os.path.islink(link_path)
+
+
+def test_get_module_paths(env):
+    with TemporaryDirectory() as dir_name:
+        os.makedirs(f"{dir_name}/repo/abc")
+        os.makedirs(f"{dir_name}/core/abc")
+        os.makedirs(f"{dir_name}/core/ghi")
+        for path in ["repo/abc", "core/abc", "core/ghi"]:
+            with open(f"{dir_name}/{path}/__manifest__.py", "w+", encoding="utf-8"):
+                pass
+
+        env._config = {
+            "repos": {f"{dir_name}/repo": {}},
+            "odoo": {"options": {"addons_path": {f"{dir_name}/core"}}},
+        }
+        assert env._get_module_paths() == {
+            "abc": f"{dir_name}/repo/abc",
+            "ghi": f"{dir_name}/core/ghi",
+        }
+
+
+def test_db_name(env):
+    env.set("odoo", "options", "db_name", value=None)
+    assert env._db_name() is None
+
+    env.set("odoo", "options", "db_name", value="odoo")
+    assert env._db_name() == "odoo"
+
+    env.set("odoo", "options", "db_name", value=" , odoo,other")
+    assert env._db_name() == "odoo"
+
+    env.set("odoo", "options", "db_name", value=["first", "second"])
+    assert env._db_name() == "first"
+    assert env._db_names() == ["first", "second"]
+
+
+def test_get_databases(env):
+    env.set("odoo", "options", "db_name", value="a,b")
+    assert env._get_databases() == ["a", "b"]
+
+    env.set("odoo", "options", "db_name", value=None)
+    env.set("odoo", "options", "dbfilter", value="prod_.*")
+    env._connect = mock.MagicMock()
+    cr = env._connect.return_value.__enter__.return_value
+    cr.fetchall.return_value = [("prod_a",), ("test_b",), ("prod_c",), ("prod_d",)]
+    # prod_d belongs to another application without Odoo tables
+    cr.fetchone.side_effect = [("ir_module_module",), ("ir_module_module",), (None,)]
+    assert env._get_databases() == ["prod_a", "prod_c"]
+    assert [c.args for c in env._connect.call_args_list] == [
+        ("postgres",),
+        ("prod_a",),
+        ("prod_c",),
+        ("prod_d",),
+    ]
+
+    env._connect.side_effect = Exception()
+    assert not env._is_odoo_database("prod_a")
+
+
+def test_connect(env):
+    psycopg2 = sys.modules["psycopg2"] = mock.MagicMock()
+    env.set("odoo", "options", "db_host", value="localhost")
+    env.set("odoo", "options", "db_port", value=False)
+
+    with env._connect("odoo") as cr:
+        assert cr == psycopg2.connect.return_value.cursor.return_value
+
+    psycopg2.connect.assert_called_once_with(dbname="odoo", host="localhost")
+    psycopg2.connect.return_value.close.assert_called_once()
+    sys.modules.pop("psycopg2")
+
+
+def test_manifests(env):
+    with TemporaryDirectory() as dir_name:
+        os.makedirs(f"{dir_name}/abc")
+        with open(f"{dir_name}/abc/__manifest__.py", "w+", encoding="utf-8") as fp:
+            fp.write("{'depends': ['base']}")
+
+        env._get_module_paths = mock.MagicMock(return_value={"abc": f"{dir_name}/abc"})
+        with mock.patch("doblib.base.CACHE_PATH", f"{dir_name}/cache"):
+            index = env._manifests()
+
+        assert index.get("abc", "depends") == ["base"]
+        assert os.path.isfile(f"{dir_name}/cache/manifests.json")
+
+
+def test_config_cache():
+    cur = os.getcwd()
+    with TemporaryDirectory() as dir_name:
+        os.chdir(dir_name)
+        try:
+            with open("odoo.base.yaml", "w+", encoding="utf-8") as fp:
+                fp.write("bootstrap:\n  version: '1.0'\n")
+            with open("odoo.yaml", "w+", encoding="utf-8") as fp:
+                fp.write("bootstrap:\n  extend: odoo.base.yaml\n  mode: ${odoo:x}\n")
+                fp.write("odoo:\n  x: prod\n  options: {}\n")
+
+            with mock.patch("doblib.base.CACHE_PATH", f"{dir_name}/.dob"):
+                env = Environment("odoo.yaml")
+                assert env.get(base.SECTION, "mode") == "prod"
+                assert os.listdir(".dob")
+
+                load = mock.patch.object(
+                    Environment,
+                    "_load_config",
+                    autospec=True,
+                    side_effect=Environment._load_config,
+                )
+                with load as mock_load:
+                    env = Environment("odoo.yaml")
+                    mock_load.assert_not_called()
+                    assert env.get(base.SECTION, "version") == "1.0"
+
+                    # Environment variables invalidate the cache
+                    with mock.patch.dict(os.environ, {"BOOTSTRAP_MODE": "dev"}):
+                        Environment("odoo.yaml")
+                        mock_load.assert_called()
+
+                # Changes of extended files invalidate the cache
+                with open("odoo.base.yaml", "w+", encoding="utf-8") as fp:
+                    fp.write("bootstrap:\n  version: '2.0'\n")
+                env = Environment("odoo.yaml")
+                assert env.get(base.SECTION, "version") == "2.0"
+
+                # Files which got created invalidate the cache
+                with open("odoo.versions.yaml", "w+", encoding="utf-8") as fp:
+                    fp.write("bootstrap:\n  version: '3.0'\n")
+                env = Environment("odoo.yaml")
+                assert env.get(base.SECTION, "version") == "3.0"
+
+                with mock.patch.dict(os.environ, {"DOB_CONFIG_CACHE": "0"}):
+                    with load as mock_load:
+                        Environment("odoo.yaml")
+                        mock_load.assert_called()
+        finally:
+            os.chdir(cur)
+
+
+def test_substitute_chained(env):
+    env._config = {
+        "a": "${b}-a",
+        "b": "${d:e}-b",
+        "c": ["${d:e}", "x"],
+        "d": {"e": "d"},
+        "f": "${c}",
+    }
+    env._resolved = {}
+    config = env._resolve(())
+    assert config["a"] == "d-b-a"
+    assert config["b"] == "d-b"
+    assert config["f"] == ["d", "x"]
+
+    env._config = {"a": "${b}", "b": {"c": "${a}"}}
+    env._resolved = {}
+    with pytest.raises(base.SubstitutionCycle, match="a -> b -> b:c -> a"):
+        env._resolve(())
+
+    env._config = {"a": {"b": "${a}"}}
+    env._resolved = {}
+    with pytest.raises(base.SubstitutionCycle):
+        env._resolve(())
+
+
+def test_link_modules_swap(env):
+    with TemporaryDirectory() as dir_name:
+        addon_path = f"{dir_name}/addons"
+        os.makedirs(f"{dir_name}/repo/abc")
+        with open(f"{dir_name}/repo/abc/__manifest__.py", "w+", encoding="utf-8"):
+            pass
+
+        # Addon paths of older versions are directories
+        os.makedirs(f"{addon_path}/old")
+        env._config = {"repos": {f"{dir_name}/repo": {}}}
+        with mock.patch("doblib.base.ADDON_PATH", addon_path):
+            env._link_modules()
+            assert os.path.islink(addon_path)
+            assert os.listdir(addon_path) == ["abc"]
+            generation = os.readlink(addon_path)
+
+            # Unchanged links don't create a new generation
+            env._link_modules()
+            assert os.readlink(addon_path) == generation
+
+            os.makedirs(f"{dir_name}/repo/def")
+            with open(f"{dir_name}/repo/def/__manifest__.py", "w+", encoding="utf-8"):
+                pass
+            env._link_modules()
+            assert os.readlink(addon_path) != generation
+            assert sorted(os.listdir(addon_path)) == ["abc", "def"]
+            assert not os.path.exists(generation)
+
+
+def test_configuration_generation_unchanged(env):
+    env.set("odoo", "options", "addons_path", value={"/b", "/a", "/c"})
+    with TemporaryDirectory() as dir_name:
+        with mock.patch("doblib.base.ODOO_CONFIG", f"{dir_name}/etc/odoo.cfg"):
+            assert env.generate(["--check"]) == 1
+            assert not os.path.exists(f"{dir_name}/etc/odoo.cfg")
+
+            assert env.generate_config() == 0
+            with open(f"{dir_name}/etc/odoo.cfg", encoding="utf-8") as fp:
+                assert "addons_path = /a,/b,/c\n" in fp.read()
+
+            stat = os.stat(f"{dir_name}/etc/odoo.cfg")
+            with mock.patch("os.replace") as replace:
+                assert env.generate_config() == 0
+                replace.assert_not_called()
+            assert env.generate(["--check"]) == 0
+            assert os.stat(f"{dir_name}/etc/odoo.cfg").st_ino == stat.st_ino
+
+            env.set("odoo", "options", "workers", value=4)
+            assert env.generate(["--check"]) == 1
+            assert env.generate([]) == 0
+            assert env.generate(["--check"]) == 0
+            assert os.listdir(f"{dir_name}/etc") == ["odoo.cfg"]
+
+
+@mock.patch("doblib.utils.available_memory", return_value=4 << 30)
+@mock.patch("doblib.utils.available_cpus", return_value=4)
+def test_autotune(cpus, memory, env):
+    env._pg_max_connections = mock.MagicMock(return_value=100)
+    tuned = env.autotune({})
+    assert tuned["max_cron_threads"] == 2
+    # 2 * 4 + 1 workers would get less than the minimal memory
+    assert tuned["workers"] == 3
+    assert tuned["limit_memory_hard"] == int(4 * (1 << 30) * 0.8) // 5
+    assert tuned["limit_memory_soft"] == tuned["limit_memory_hard"] * 4 // 5
+    assert tuned["db_maxconn"] == 80 // 6
+
+    # Explicit values are kept and used for the calculation
+    tuned = env.autotune({"workers": 3, "max_cron_threads": 1, "db_maxconn": 8})
+    assert "workers" not in tuned and "db_maxconn" not in tuned
+    assert tuned["limit_memory_hard"] == int(4 * (1 << 30) * 0.8) // 4
+
+    # Not enough memory for the workers keeps the limits of Odoo
+    tuned = env.autotune({"workers": 9})
+    assert "limit_memory_hard" not in tuned and "limit_memory_soft" not in tuned
+
+    memory.return_value = 1 << 30
+    tuned = env.autotune({})
+    assert tuned["workers"] == 2
+    assert "limit_memory_hard" not in tuned
+    memory.return_value = 4 << 30
+
+    env._pg_max_connections.return_value = None
+    memory.return_value = None
+    assert env.autotune({}) == {"workers": 9, "max_cron_threads": 2}
+
+    env.set(base.SECTION, "autotune", value=True)
+    env.set("odoo", "options", "workers", value=None)
+    assert "workers = 9\n" in env.render_config()
+
+
+def test_pg_max_connections(env):
+    env._connect = mock.MagicMock()
+    cr = env._connect.return_value.__enter__.return_value
+    cr.fetchone.return_value = ("100",)
+    assert env._pg_max_connections() == 100
+
+    env._connect.side_effect = Exception()
+    assert env._pg_max_connections() is None
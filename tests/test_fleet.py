@@ -0,0 +1,47 @@
+# © 2026 initOS GmbH
+# License Apache-2.0 (http://www.apache.org/licenses/).
+
+import os
+import sys
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from doblib.fleet import run_each
+
+
+def test_run_each(capsys):
+    with TemporaryDirectory() as dir_name:
+        assert run_each(f"{dir_name}/*/odoo.yaml", "update", []) == 1
+
+        for name in ("a", "b"):
+            os.makedirs(f"{dir_name}/{name}")
+            with open(f"{dir_name}/{name}/odoo.yaml", "w+", encoding="utf-8"):
+                pass
+
+        results = {f"{dir_name}/a/odoo.yaml": (0, 1.0)}
+        results[f"{dir_name}/b/odoo.yaml"] = (2, 1.5)
+        with mock.patch("doblib.utils.run_parallel", return_value=results) as run:
+            assert run_each(f"{dir_name}/*/odoo.yaml", "u", ["--all"], 3) == 1
+
+        commands, jobs = run.call_args.args
+        assert jobs == 3
+        assert run.call_args.kwargs["log_dir"].endswith("each")
+        cmd, env, cwd = commands[os.path.relpath(f"{dir_name}/a/odoo.yaml")]
+        assert cmd == [
+            sys.executable,
+            *("-m", "doblib", "-c", "odoo.yaml", "--logging", "info"),
+            *("u", "--all"),
+        ]
+        assert cwd == f"{dir_name}/a"
+        assert "failed (2)" in capsys.readouterr().out
+
+        # Configuration files in the current directory
+        cur = os.getcwd()
+        os.chdir(f"{dir_name}/a")
+        try:
+            with mock.patch("doblib.utils.run_parallel", return_value={}) as run:
+                assert run_each("odoo.yaml", "u", []) == 0
+            commands, _ = run.call_args.args
+            assert commands["odoo.yaml"][2] == "."
+        finally:
+            os.chdir(cur)
@@ -1,12 +1,18 @@
 # © 2021 Florian Kantelberg (initOS GmbH)
 # License Apache-2.0 (http://www.apache.org/licenses/).
 
+import os
+import subprocess
 import sys
 from tempfile import NamedTemporaryFile
-from unittest.mock import MagicMock, patch
+from unittest.mock import ANY, MagicMock, patch
 
+import doblib
 from doblib.__main__ import main
 
+# Time budget in seconds to import dob and show the configuration
+IMPORT_BUDGET = 1.0
+
 
 @patch("sys.exit")
 @patch("doblib.utils.get_config_file")
@@ -14,22 +20,22 @@ def test_config(config_mock, exit_mock):  # pylint: disable=R0915
     with NamedTemporaryFile() as fp:
         config_mock.return_value = fp.name
 
-        with patch("doblib.__main__.Environment") as mock:
+        with patch("doblib.env.Environment") as mock:
             main(["c", "additional"])
             mock.assert_called_once_with(fp.name)
             mock.return_value.config.assert_called_once_with(["additional"])
 
-        with patch("doblib.__main__.FreezeEnvironment") as mock:
+        with patch("doblib.freeze.FreezeEnvironment") as mock:
             main(["f", "additional"])
             mock.assert_called_once_with(fp.name)
             mock.return_value.freeze.assert_called_once_with(["additional"])
 
-        with patch("doblib.__main__.AggregateEnvironment") as mock:
+        with patch("doblib.aggregate.AggregateEnvironment") as mock:
             main(["i", "additional"])
             mock.assert_called_once_with(fp.name)
             mock.return_value.init.assert_called_once_with(["additional"])
 
-        with patch("doblib.__main__.RunEnvironment") as mock:
+        with patch("doblib.run.RunEnvironment") as mock:
             main(["s", "additional"])
             mock.assert_called_once_with(fp.name)
             mock.return_value.shell.assert_called_once_with(["additional"])
@@ -39,12 +45,12 @@ def test_config(config_mock, exit_mock):  # pylint: disable=R0915
             mock.assert_called_once_with(fp.name)
             mock.return_value.start.assert_called_once_with(["additional"])
 
-        with patch("doblib.__main__.CIEnvironment") as mock:
+        with patch("doblib.ci.CIEnvironment") as mock:
             main(["t", "additional"])
             mock.assert_called_once_with(fp.name)
             mock.return_value.test.assert_called_once_with(["additional"])
 
-        with patch("doblib.__main__.CIEnvironment") as mock:
+        with patch("doblib.ci.CIEnvironment") as mock:
             main(["flake8", "additional"])
             mock.assert_called_once_with(fp.name)
             mock.return_value.ci.assert_called_once_with("flake8", ["additional"])
@@ -59,17 +65,17 @@ def test_config(config_mock, exit_mock):  # pylint: disable=R0915
             mock.assert_called_once_with(fp.name)
             mock.return_value.ci.assert_called_with("pylint", ["additional"])
 
-        with patch("doblib.__main__.ModuleEnvironment") as mock:
+        with patch("doblib.module.ModuleEnvironment") as mock:
             main(["u", "additional"])
             mock.assert_called_once_with(fp.name)
             mock.return_value.update.assert_called_once_with(["additional"])
 
-        with patch("doblib.__main__.ActionEnvironment") as mock:
+        with patch("doblib.action.ActionEnvironment") as mock:
             main(["a", "additional"])
             mock.assert_called_once_with(fp.name)
             mock.return_value.apply_action.assert_called_once_with(["additional"])
 
-        with patch("doblib.__main__.AggregateEnvironment") as mock:
+        with patch("doblib.aggregate.AggregateEnvironment") as mock:
             main(["show-all-prs", "additional"])
             mock.assert_called_once_with(fp.name)
             mock.return_value.aggregate.assert_called_once_with(
@@ -90,6 +96,7 @@ def test_config(config_mock, exit_mock):  # pylint: disable=R0915
 def test_help(arg_mock):
     arg = MagicMock()
     arg.command = "unknown"
+    arg.each = None
     arg_mock.return_value = (arg, [])
     sys.argv = ["", "--help"]
     main()
@@ -99,3 +106,53 @@ def test_help(arg_mock):
     arg_mock.reset_mock()
     main()
     arg_mock.assert_called_with(["--help"])
+
+
+def test_lazy_imports():
+    # Run `dob config` in a fresh interpreter to measure the real startup
+    path = os.path.dirname(os.path.dirname(doblib.__file__))
+    env = dict(os.environ, PYTHONPATH=path, DOB_CONFIG_CACHE="0")
+    code = (
+        "import sys, time; start = time.perf_counter()\n"
+        "from doblib.__main__ import main\n"
+        "main(['c', '-c', 'odoo.local.yaml', 'bootstrap'])\n"
+        "heavy = ('pytest', 'git_aggregator', 'dateutil', 'doblib.module')\n"
+        "print(sorted(m for m in heavy if m in sys.modules))\n"
+        "print(time.perf_counter() - start)\n"
+    )
+    output = subprocess.check_output(
+        [sys.executable, "-c", code], cwd="tests/environment", env=env, text=True
+    )
+    *_, modules, elapsed = output.splitlines()
+    assert modules == "[]"
+    assert float(elapsed) < IMPORT_BUDGET
+
+
+@patch("sys.exit")
+@patch("doblib.daemon.forward")
+def test_daemon_forward(forward_mock, exit_mock):
+    forward_mock.return_value = 5
+    with patch("doblib.module.ModuleEnvironment") as mock:
+        main(["u", "--all"])
+        forward_mock.assert_called_once_with(["u", "--all"], "u", cfg=ANY)
+        exit_mock.assert_called_once_with(5)
+        mock.assert_not_called()
+
+    forward_mock.return_value = None
+    with patch("doblib.module.ModuleEnvironment") as mock:
+        main(["u"])
+        mock.return_value.update.assert_called_once_with([])
+
+    # Tests always run in a fresh process
+    forward_mock.reset_mock()
+    with patch("doblib.ci.CIEnvironment"):
+        main(["t"])
+    forward_mock.assert_not_called()
+
+
+@patch("sys.exit")
+@patch("doblib.fleet.run_each", return_value=1)
+def test_each(each_mock, exit_mock):
+    main(["--each", "projects/*/odoo.yaml", "--each-jobs", "2", "u", "--all"])
+    each_mock.assert_called_once_with("projects/*/odoo.yaml", "u", ["--all"], 2, "info")
+    exit_mock.assert_called_once_with(1)
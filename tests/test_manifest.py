@@ -0,0 +1,76 @@
+# © 2026 initOS GmbH
+# License Apache-2.0 (http://www.apache.org/licenses/).
+
+import os
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from doblib.manifest import ManifestIndex, read_manifest
+
+
+def write_manifest(path, manifest):
+    os.makedirs(path, exist_ok=True)
+    with open(f"{path}/__manifest__.py", "w+", encoding="utf-8") as fp:
+        fp.write(manifest)
+
+
+def test_read_manifest():
+    with TemporaryDirectory() as dir_name:
+        write_manifest(dir_name, "{'name': 'a', 'depends': ['base']}")
+        assert read_manifest(f"{dir_name}/__manifest__.py") == {
+            "name": "a",
+            "depends": ["base"],
+        }
+
+        # Code isn't executed
+        write_manifest(dir_name, "__import__('os').remove('file')")
+        assert read_manifest(f"{dir_name}/__manifest__.py") == {}
+
+        write_manifest(dir_name, "['a']")
+        assert read_manifest(f"{dir_name}/__manifest__.py") == {}
+
+        assert read_manifest(f"{dir_name}/missing.py") == {}
+
+
+def test_refresh():
+    with TemporaryDirectory() as dir_name:
+        write_manifest(f"{dir_name}/a", "{'version': '1.0', 'data': ['a.xml']}")
+        write_manifest(f"{dir_name}/b", "{'depends': ['a'], 'auto_install': True}")
+        modules = {"a": f"{dir_name}/a", "b": f"{dir_name}/b"}
+
+        index = ManifestIndex(f"{dir_name}/cache/manifests.json").refresh(modules)
+        assert index.get("a", "version") == "1.0"
+        assert index.get("a", "data") == ["a.xml"]
+        assert index.get("a", "installable") is True
+        assert index.get("b", "depends") == ["a"]
+        assert index.get("b", "auto_install") is True
+        assert index.get("c") is None
+        index.save()
+
+        # Unchanged manifests aren't parsed again
+        index = ManifestIndex(f"{dir_name}/cache/manifests.json")
+        with mock.patch("doblib.manifest.read_manifest") as read_mock:
+            index.refresh(modules)
+            read_mock.assert_not_called()
+
+        write_manifest(f"{dir_name}/a", "{'version': '2.0'}")
+        index.refresh({"a": f"{dir_name}/a", "c": f"{dir_name}/c"})
+        assert index.get("a", "version") == "2.0"
+        assert set(index.modules) == {"a"}
+
+
+def test_closures():
+    index = ManifestIndex("/nonexisting/manifests.json")
+    index.modules = {
+        "base": {"depends": []},
+        "a": {"depends": ["base"]},
+        "b": {"depends": ["a"]},
+        "c": {"depends": ["base", "b"]},
+        "d": {"depends": ["base"]},
+    }
+
+    assert index.dependencies(["b"]) == {"base", "a", "b"}
+    assert index.dependencies(["unknown"]) == {"unknown"}
+    assert index.dependents(["a"]) == {"a", "b", "c"}
+    assert index.dependents(["base"]) == set(index.modules)
+    assert index.dependents(["d"]) == {"d"}
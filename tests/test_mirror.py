@@ -0,0 +1,98 @@
+# © 2026 initOS GmbH
+# License Apache-2.0 (http://www.apache.org/licenses/).
+
+import os
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from doblib import base
+from doblib.aggregate import AggregateEnvironment
+from doblib.mirror import MirrorCache, git, mirror_ref
+
+
+def create_upstream(path):
+    git("init", "--quiet", "-b", "main", path)
+    git("config", "user.email", "dob@example.org", cwd=path)
+    git("config", "user.name", "dob", cwd=path)
+    with open(f"{path}/README", "w+", encoding="utf-8") as fp:
+        fp.write("dob")
+    git("add", "README", cwd=path)
+    git("commit", "--quiet", "-m", "Initial", cwd=path)
+
+
+def repo_dict(cwd, url, **kwargs):
+    return {
+        "cwd": cwd,
+        "remotes": [{"name": "origin", "url": url}],
+        "merges": [{"remote": "origin", "ref": "main"}],
+        "target": {"remote": None, "branch": "main"},
+        **kwargs,
+    }
+
+
+def test_mirror_ref():
+    assert mirror_ref("main") == "refs/mirror/main"
+    assert mirror_ref("refs/pull/1/head") == "refs/mirror/pull/1/head"
+
+
+def test_mirror_cache():
+    with TemporaryDirectory() as dir_name:
+        upstream = f"{dir_name}/upstream"
+        create_upstream(upstream)
+
+        mirrors = MirrorCache(f"{dir_name}/mirrors")
+        mirrors.collect(repo_dict(f"{dir_name}/a", upstream))
+        mirrors.collect(repo_dict(f"{dir_name}/b", upstream))
+        mirrors.collect(repo_dict(f"{dir_name}/c", upstream, defaults={"depth": 1}))
+        mirrors.collect(repo_dict(f"{dir_name}/d", f"{dir_name}/missing"))
+
+        # Shallow repositories aren't mirrored
+        assert set(mirrors.mirrored) == {f"{dir_name}/{x}" for x in "abd"}
+        assert mirrors.update(2) == {f"{dir_name}/missing"}
+
+        path = mirrors.mirror_path(upstream)
+        head = git("rev-parse", "main", cwd=upstream)
+        assert git("rev-parse", "refs/mirror/main", cwd=path) == head
+
+        assert mirrors.link(f"{dir_name}/a")
+        assert mirrors.link(f"{dir_name}/a")
+        assert not mirrors.link(f"{dir_name}/c")
+        assert not mirrors.link(f"{dir_name}/d")
+
+        alternates = f"{dir_name}/a/.git/objects/info/alternates"
+        with open(alternates, encoding="utf-8") as fp:
+            assert fp.read() == f"{path}/objects\n"
+
+        # The objects are available without fetching
+        assert git("cat-file", "-t", head.strip(), cwd=f"{dir_name}/a") == "commit\n"
+
+
+def test_aggregate_with_mirrors():
+    cur = os.getcwd()
+    os.chdir("tests/environment/")
+    env = AggregateEnvironment("odoo.local.yaml")
+    os.chdir(cur)
+
+    with TemporaryDirectory() as dir_name:
+        upstream = f"{dir_name}/upstream"
+        create_upstream(upstream)
+
+        repos = [repo_dict(f"{dir_name}/{x}", upstream) for x in "ab"]
+        with mock.patch("doblib.base.CACHE_PATH", dir_name):
+            with mock.patch("doblib.aggregate.get_repos", return_value=repos):
+                # A path for the mirrors is required
+                env.set(base.SECTION, "mirror_cache", value=True)
+                assert env._mirror_cache(repos, mock.MagicMock(), None) is None
+
+                env.set(base.SECTION, "mirror_cache", value=f"{dir_name}/mirrors")
+                assert not env.init(["--no-config", "-j", "2"])
+
+        mirrors = MirrorCache(f"{dir_name}/mirrors")
+        with open(f"{dir_name}/a/.git/objects/info/alternates", encoding="utf-8") as fp:
+            assert fp.read() == f"{mirrors.mirror_path(upstream)}/objects\n"
+
+        head = git("rev-parse", "HEAD", cwd=upstream)
+        for name in "ab":
+            assert git("rev-parse", "HEAD", cwd=f"{dir_name}/{name}") == head
+            assert os.path.isfile(f"{dir_name}/{name}/README")
+            assert os.path.isfile(f"{dir_name}/{name}/.git/objects/info/alternates")
@@ -4,12 +4,15 @@
 import argparse
 import os
 import sys
+from tempfile import TemporaryDirectory
 from unittest import mock
 
 import pytest
 
 from doblib import base
-from doblib.module import ModuleEnvironment, no_flags
+from doblib.checksum import ChecksumIndex
+from doblib.manifest import ManifestIndex
+from doblib.module import ModuleEnvironment, load_update_arguments, no_flags
 
 
 @pytest.fixture
@@ -72,7 +75,7 @@ def test_run_migration_sql(env):
 
         # Existing migration
         env._run_migration_sql("odoo", "post_update.sql")
-        cursor.execute.assert_called_once_with("SELECT * FROM res_partner;\n")
+        cursor.execute.assert_called_once_with("SELECT * FROM res_partner;")
     finally:
         os.chdir(cur)
 
@@ -96,8 +99,15 @@ def test_get_modules(env):
 
 
 def test_get_installed_modules(env):
+    odoo = mock_odoo_import()
+    cr = odoo.sql_db.db_connect.return_value.cursor.return_value
+    cr.fetchall.return_value = [("normal",)]
     env.env = mock.MagicMock()
-    assert env._get_installed_modules("odoo") == {"base"}
+
+    assert env._get_installed_modules("odoo") == {"base", "normal"}
+    odoo.sql_db.db_connect.assert_called_once_with("odoo")
+    # No registry is loaded
+    env.env.assert_not_called()
 
 
 def test_install_all(env):
@@ -126,7 +136,7 @@ def test_update_all(env):
 
 def test_update_listed(env):
     odoo = mock_odoo_import()
-    env._get_modules = mock.MagicMock()
+    env._get_modules = mock.MagicMock(return_value={"normal"})
 
     env.update_specific("odoo", listed=True)
     odoo.modules.registry.Registry.new.assert_called_once_with(
@@ -152,6 +162,57 @@ def test_update_changed(env):
         "odoo", blacklist=["abc"], installed=True
     )
 
+    # Use the changed modules of the checksum index
+    env.update_specific.reset_mock()
+    env.update_checksums = mock.MagicMock()
+    env.update_changed("odoo", ["abc"], changed=set())
+    env.update_specific.assert_not_called()
+    env.update_checksums.assert_called_once_with("odoo")
+
+    env.update_changed("odoo", ["abc"], changed={"def"})
+    env.update_specific.assert_called_once_with(
+        "odoo", whitelist={"def"}, blacklist=["abc"]
+    )
+
+
+def test_update_checksum_index(env):
+    odoo = mock_odoo_import()
+    odoo.tools.config.__getitem__.return_value = "odoo"
+    odoo.modules.db.is_initialized.return_value = True
+    env.generate_config = mock.MagicMock()
+    env._init_odoo = mock.MagicMock(return_value=True)
+    env._get_installed_modules = mock.MagicMock(return_value={"normal"})
+    env._get_module_paths = mock.MagicMock(return_value={})
+    env.update_changed = mock.MagicMock()
+    env.check_auto_install = mock.MagicMock()
+    env.env = mock.MagicMock()
+    env._migration_path = mock.MagicMock(return_value="pre_update.py")
+
+    index = mock.MagicMock()
+    index.checksums.return_value = {"normal": "1"}
+    env._checksum_index = mock.MagicMock(return_value=index)
+    env._stored_checksums = mock.MagicMock(return_value={"normal": "0"})
+    env._store_checksums = mock.MagicMock()
+    env.set(base.SECTION, "checksums", value=True)
+
+    env.update()
+    env._stored_checksums.assert_called_once_with("odoo")
+    env.update_changed.assert_called_once_with("odoo", set(), changed={"normal"})
+    env._store_checksums.assert_called_once_with("odoo", {"normal": "1"})
+    index.save.assert_called_once()
+
+    # Updating specific modules keeps the stored checksums
+    env._store_checksums.reset_mock()
+    env.update_specific = mock.MagicMock()
+    env.update(["normal"])
+    env.update_specific.assert_called_once()
+    env._store_checksums.assert_not_called()
+
+    env.update(["--listed"])
+    env._store_checksums.assert_not_called()
+
+    assert isinstance(ModuleEnvironment._checksum_index(env), ChecksumIndex)
+
 
 def test_update(env):
     # Quite complex and we have to mock plenty of stuff
@@ -165,6 +226,7 @@ def test_update(env):
     env.update_changed = mock.MagicMock()
     env.update_specific = mock.MagicMock()
     env._init_odoo = mock.MagicMock(return_value=False)
+    env._migration_path = mock.MagicMock(return_value="pre_update.py")
 
     # Init of odoo isn't possible
     env.update()
@@ -200,8 +262,489 @@ def test_update(env):
     )
 
 
+def test_update_profile(env):
+    odoo = mock_odoo_import()
+    odoo.tools.config.__getitem__.return_value = "odoo"
+    odoo.modules.db.is_initialized.return_value = True
+    env.generate_config = mock.MagicMock()
+    env._init_odoo = mock.MagicMock(return_value=True)
+    env._install_and_update = mock.MagicMock()
+    env._get_installed_modules = mock.MagicMock(return_value={"normal"})
+    env.env = mock.MagicMock()
+
+    with mock.patch("doblib.module.ModuleProfiler") as profiler:
+        env.update()
+        profiler.assert_not_called()
+
+        env.update(["--profile"])
+        profiler.return_value.__enter__.assert_called_once()
+        profiler.return_value.write.assert_called_once_with("update-profile")
+
+        # Modules following the flag aren't taken as prefix
+        args, _ = load_update_arguments(["--profile", "sale", "stock"])
+        assert args.modules == ["sale", "stock"]
+        assert args.profile_prefix == "update-profile"
+
+
+def test_update_databases(env):
+    env._get_databases = mock.MagicMock(return_value=[])
+    assert env.update(["--all-databases"]) == 1
+
+    env._get_databases.return_value = ["a", "b"]
+    env.set("odoo", "options", "db_name", value="a,b")
+    with mock.patch("doblib.utils.run_parallel") as run:
+        run.return_value = {"a": (0, 1.0), "b": (0, 2.0)}
+        assert env.update(["--all-databases", "-j", "2", "--all", "--jobs=3"]) == 0
+
+        commands, jobs = run.call_args[0]
+        assert jobs == 3
+        cmd, proc_env = commands["b"]
+        assert cmd[1:] == [
+            "-m",
+            "doblib",
+            "update",
+            "-c",
+            "odoo.local.yaml",
+            "--database",
+            "b",
+            "--all",
+        ]
+        assert proc_env["ODOO_CONFIG"] == "odoo.b.cfg"
+
+        run.return_value = {"a": (0, 1.0), "b": (1, 2.0)}
+        assert env.update(["--all-databases"]) == 1
+
+        # Separate profiles per database and options for the workers
+        run.return_value = {}
+        args = ["--all-databases", "--profile", "--profile-prefix", "prof"]
+        args.append("--prewarm-assets")
+        assert env.update(args + ["--asset-jobs", "4"]) == 0
+        commands, _ = run.call_args[0]
+        cmd, _ = commands["a"]
+        assert cmd[-1] == "--profile-prefix=prof.a"
+        assert cmd[-4:-1] == ["--prewarm-assets", "--asset-jobs", "4"]
+        assert "--no-initialize" not in cmd
+
+        # Discovered databases are never initialized
+        env._db_names = mock.MagicMock(return_value=[])
+        assert env.update(["--all-databases"]) == 0
+        commands, _ = run.call_args[0]
+        assert commands["a"][0][-1] == "--no-initialize"
+
+
+def test_update_no_initialize(env):
+    odoo = mock_odoo_import()
+    odoo.tools.config.__getitem__.return_value = "other"
+    odoo.modules.db.is_initialized.return_value = False
+    env.generate_config = mock.MagicMock()
+    env._init_odoo = mock.MagicMock(return_value=True)
+    env._get_module_paths = mock.MagicMock(return_value={})
+    env.install_all = mock.MagicMock()
+
+    assert env.update(["--database", "other", "--no-initialize"]) == 1
+    env.install_all.assert_not_called()
+
+
+def test_update_database(env):
+    env.generate_config = mock.MagicMock()
+    env._init_odoo = mock.MagicMock(return_value=False)
+    env.update(["--database", "other"])
+    assert env._db_name() == "other"
+
+
+def test_load_registry(env):
+    odoo = mock_odoo_import()
+    registry = odoo.modules.registry.Registry
+
+    # Nothing to install or upgrade reuses the loaded registry
+    assert env.load_registry("odoo") == registry.return_value
+    registry.assert_called_once_with("odoo")
+    registry.new.assert_not_called()
+
+    env.load_registry("odoo", install={"a"}, upgrade={"b"})
+    registry.new.assert_called_once_with("odoo", update_module=True, force_demo=False)
+    odoo.tools.config.__setitem__.assert_any_call("init", {"a": 1})
+    odoo.tools.config.__setitem__.assert_any_call("update", {"b": 1})
+
+    registry.new.reset_mock()
+    odoo.release.version_info = (19,)
+    env.load_registry("odoo", install={"a"}, upgrade={"c", "b"})
+    registry.new.assert_called_once_with(
+        "odoo", update_module=True, install_modules=["a"], upgrade_modules=["b", "c"]
+    )
+
+
+def test_get_changed_modules(env):
+    env._get_installed_modules = mock.MagicMock(return_value={"base", "a", "b"})
+    assert env._get_changed_modules("odoo", ["b"], changed={"a", "b", "c"}) == {"a"}
+
+    env.env = mock.MagicMock()
+    model = env.env.return_value.__enter__.return_value["ir.module.module"]
+    model._get_modules_with_changed_checksum.return_value.mapped.return_value = [
+        "b",
+        "c",
+    ]
+    assert env._get_changed_modules("odoo") == {"b"}
+
+    env.env.return_value.__enter__.return_value = {"ir.module.module": None}
+    assert env._get_changed_modules("odoo") == {"base"}
+
+
+def test_update_single_registry(env):
+    odoo = mock_odoo_import()
+    odoo.tools.config.__getitem__.return_value = "odoo"
+    odoo.modules.db.is_initialized.return_value = True
+    env.generate_config = mock.MagicMock()
+    env._init_odoo = mock.MagicMock(return_value=True)
+    env._get_installed_modules = mock.MagicMock(return_value={"base", "a"})
+    env._get_changed_modules = mock.MagicMock(return_value={"a"})
+    env._migration_path = mock.MagicMock(return_value=None)
+    env.load_registry = mock.MagicMock()
+    env.install_all = mock.MagicMock()
+    env.update_changed = mock.MagicMock()
+    env.update_specific = mock.MagicMock()
+    env.update_checksums = mock.MagicMock()
+    env.check_auto_install = mock.MagicMock()
+    env.env = mock.MagicMock()
+
+    env.update()
+    env.load_registry.assert_called_once_with("odoo", install={"normal"}, upgrade={"a"})
+    env.update_checksums.assert_called_once_with("odoo")
+    env.check_auto_install.assert_called_once_with("odoo")
+    env.install_all.assert_not_called()
+    env.update_changed.assert_not_called()
+    env.update_specific.assert_not_called()
+
+    # Updating specific modules keeps the stored checksums
+    env.load_registry.reset_mock()
+    env.update_checksums.reset_mock()
+    env.update(["a"])
+    env.load_registry.assert_called_once_with("odoo", install={"normal"}, upgrade={"a"})
+    env.update_checksums.assert_not_called()
+
+
+def test_auto_install_modules(env):
+    odoo_env = mock.MagicMock()
+    odoo_env["ir.module.module"]._fields = {}
+    odoo_env.cr.fetchall.side_effect = [
+        # Uninstalled auto install modules with their dependencies
+        [
+            (1, "a", "base"),
+            (2, "b", "a"),
+            (2, "b", "sale"),
+            (3, "c", "missing"),
+            (4, "d", None),
+            (5, "e", "b"),
+            (5, "e", "c"),
+        ],
+        # Installed dependencies
+        [("base",), ("sale",)],
+    ]
+    assert env._get_auto_install_modules(odoo_env) == [1, 2, 4]
+
+    # Country restrictions
+    field = mock.MagicMock(column1="module_id", column2="country_id")
+    field.relation = "module_country"
+    odoo_env["ir.module.module"]._fields = {"country_ids": field}
+    odoo_env["res.company"].search.return_value.mapped.return_value.ids = [7]
+    odoo_env.cr.fetchall.side_effect = [
+        [(1, "a", "base"), (2, "b", "a"), (3, "c", None)],
+        [(1, 8), (3, 7), (3, 8)],
+        [("base",)],
+    ]
+    assert env._get_auto_install_modules(odoo_env) == [3]
+
+
+def test_check_auto_install(env):
+    env.env = mock.MagicMock()
+    odoo_env = env.env.return_value.__enter__.return_value
+    env._get_auto_install_modules = mock.MagicMock(return_value=[])
+    env.check_auto_install("odoo")
+    odoo_env["ir.module.module"].browse.assert_not_called()
+
+    env._get_auto_install_modules.return_value = [1, 2]
+    env.check_auto_install("odoo")
+    odoo_env["ir.module.module"].browse.assert_called_once_with([1, 2])
+    browse = odoo_env["ir.module.module"].browse.return_value
+    browse.button_immediate_install.assert_called_once()
+
+
 def test_no_flags():
     with pytest.raises(argparse.ArgumentTypeError):
         no_flags("-invalid")
 
     assert no_flags("valid") == "valid"
+
+
+def test_get_index_changes(env):
+    index = mock.MagicMock()
+    env._stored_checksums = mock.MagicMock(return_value={"a": "0", "b": "1"})
+    assert env._get_index_changes("odoo", None, {}) is None
+    assert env._get_index_changes("odoo", index, {}) is None
+
+    env.set(base.SECTION, "checksums", value=True)
+    assert env._get_index_changes("odoo", index, {"a": "1", "b": "1"}) == {"a"}
+    env._stored_checksums.assert_called_once_with("odoo")
+
+    env._manifests = mock.MagicMock()
+    env._manifests.return_value.dependents.return_value = {"a", "b"}
+    checksums = {"a": "1"}
+    assert env._get_index_changes("odoo", index, checksums, closure=True) == {
+        "a",
+        "b",
+    }
+    env._manifests.return_value.dependents.assert_called_once_with({"a"})
+
+    # Databases without stored checksums, e.g. restored from a dump
+    env._stored_checksums.return_value = None
+    assert env._get_index_changes("odoo", index, {}, closure=True) is None
+
+
+def test_stored_checksums(env):
+    assert env._stored_checksums(None) is None
+
+    env._connect = mock.MagicMock()
+    cr = env._connect.return_value.__enter__.return_value
+    cr.fetchone.return_value = ("dob_module_checksum",)
+    cr.fetchall.return_value = [("a", "1")]
+    assert env._stored_checksums("odoo") == {"a": "1"}
+    env._connect.assert_called_once_with("odoo")
+
+    env._connect.side_effect = Exception()
+    assert env._stored_checksums("odoo") is None
+
+
+def test_update_changed_closure(env):
+    odoo = mock_odoo_import()
+    odoo.tools.config.__getitem__.return_value = "odoo"
+    odoo.modules.db.is_initialized.return_value = True
+    env.generate_config = mock.MagicMock()
+    env._init_odoo = mock.MagicMock(return_value=True)
+    env._get_installed_modules = mock.MagicMock(return_value={"base", "a", "b"})
+    env._get_module_paths = mock.MagicMock(return_value={})
+    env._migration_path = mock.MagicMock(return_value=None)
+    env._get_index_changes = mock.MagicMock(return_value={"a", "b", "c"})
+    env.load_registry = mock.MagicMock()
+    env.update_checksums = mock.MagicMock()
+    env.check_auto_install = mock.MagicMock()
+    env.env = mock.MagicMock()
+
+    with mock.patch("doblib.module.ChecksumIndex") as index:
+        env.update(["--changed-closure"])
+        index.assert_called_once()
+        env._get_index_changes.assert_called_once_with(
+            "odoo",
+            index.return_value,
+            index.return_value.checksums.return_value,
+            closure=True,
+        )
+
+    env.load_registry.assert_called_once_with(
+        "odoo", install={"normal"}, upgrade={"a", "b"}
+    )
+
+
+def test_fingerprint(env):
+    assert env._fingerprint(None, {}) is None
+
+    env.set(base.SECTION, "fingerprint", value=True)
+    cur = os.getcwd()
+    with TemporaryDirectory() as dir_name:
+        os.chdir(dir_name)
+        try:
+            index = ChecksumIndex(f"{dir_name}/index.json")
+            fingerprint = env._fingerprint(index, {"normal": "1"})
+            assert fingerprint == env._fingerprint(index, {"normal": "1"})
+            assert fingerprint != env._fingerprint(index, {"normal": "2"})
+
+            with open("post_update.py", "w+", encoding="utf-8") as fp:
+                fp.write("def migrate(env, version): pass")
+            assert fingerprint != env._fingerprint(index, {"normal": "1"})
+            fingerprint = env._fingerprint(index, {"normal": "1"})
+
+            os.makedirs("pre_update")
+            with open("pre_update/__init__.py", "w+", encoding="utf-8"):
+                pass
+            assert fingerprint != env._fingerprint(index, {"normal": "1"})
+            fingerprint = env._fingerprint(index, {"normal": "1"})
+
+            env.set(base.SECTION, "version", value="1.0")
+            assert fingerprint != env._fingerprint(index, {"normal": "1"})
+        finally:
+            os.chdir(cur)
+
+
+def test_stored_fingerprint(env):
+    assert env._stored_fingerprint(None) is None
+
+    env._connect = mock.MagicMock()
+    cr = env._connect.return_value.__enter__.return_value
+    cr.fetchone.return_value = ("abc",)
+    assert env._stored_fingerprint("odoo") == "abc"
+    env._connect.assert_called_once_with("odoo")
+
+    cr.fetchone.return_value = None
+    assert env._stored_fingerprint("odoo") is None
+
+    env._connect.side_effect = Exception()
+    assert env._stored_fingerprint("odoo") is None
+
+
+def test_update_fingerprint(env):
+    odoo = mock_odoo_import()
+    odoo.tools.config.__getitem__.return_value = "odoo"
+    odoo.modules.db.is_initialized.return_value = True
+    env.generate_config = mock.MagicMock()
+    env._init_odoo = mock.MagicMock(return_value=True)
+    env._get_installed_modules = mock.MagicMock(return_value={"normal"})
+    env._get_module_paths = mock.MagicMock(return_value={})
+    env.update_changed = mock.MagicMock()
+    env.update_specific = mock.MagicMock()
+    env.check_auto_install = mock.MagicMock()
+    env.env = mock.MagicMock()
+    env._migration_path = mock.MagicMock(return_value="pre_update.py")
+    env.set("odoo", "options", "db_name", value="odoo")
+    env.set(base.SECTION, "fingerprint", value=True)
+    env._stored_fingerprint = mock.MagicMock(return_value="abc")
+    env._fingerprint = mock.MagicMock(return_value="abc")
+
+    with TemporaryDirectory() as dir_name:
+        env._checksum_index = mock.MagicMock(
+            return_value=ChecksumIndex(f"{dir_name}/index.json")
+        )
+
+        # Nothing changed
+        env.update()
+        env._stored_fingerprint.assert_called_once_with("odoo")
+        env._init_odoo.assert_not_called()
+
+        # Explicit arguments always run the update
+        env.update(["--all"])
+        env._init_odoo.assert_called_once()
+        env.update_specific.assert_called_once()
+        params = env.env.return_value.__enter__.return_value["ir.config_parameter"]
+        params.set_param.assert_called_with("db_fingerprint", "abc")
+
+        env.update(["abc"])
+        params.set_param.assert_called_with("db_fingerprint", "")
+
+        # Changed fingerprint
+        env._init_odoo.reset_mock()
+        env._fingerprint.return_value = "def"
+        env.update()
+        env._init_odoo.assert_called_once()
+        env.update_changed.assert_called_once()
+        params.set_param.assert_called_with("db_fingerprint", "def")
+
+
+def test_translation_cache(env):
+    assert env._translation_cache("odoo") is None
+
+    odoo = mock_odoo_import()
+    cr = odoo.sql_db.db_connect.return_value.cursor.return_value
+    cr.fetchall.side_effect = [[("en_US",)], [("normal", "abc")]]
+    env.set(base.SECTION, "translation_cache", value=True)
+    env.set("odoo", "options", "load_language", value="de_DE, fr_FR")
+    env._get_module_paths = mock.MagicMock(return_value={})
+    with TemporaryDirectory() as dir_name:
+        with mock.patch("doblib.base.CACHE_PATH", dir_name):
+            cache = env._translation_cache("odoo")
+
+    assert cache.languages == "de_DE,en_US,fr_FR"
+    assert not cache.active
+    cr.commit.assert_called_once()
+
+    cr.reset_mock()
+    cache.loaded.add("normal")
+    cache.checksums["normal"] = "abc"
+    env._store_translation_cache("odoo", cache)
+    assert cr.execute.call_count == 2
+    cr.commit.assert_called_once()
+
+
+def test_prewarm_assets(env):
+    env.odoo_version = mock.MagicMock(return_value=(16,))
+    env.env = mock.MagicMock()
+    env.prewarm_assets("odoo")
+    env.env.assert_not_called()
+
+    env.odoo_version.return_value = (17,)
+    odoo_env = env.env.return_value.__enter__.return_value
+    lang = mock.MagicMock(direction="rtl")
+    odoo_env["res.lang"].with_context.return_value.search.return_value = [lang]
+    qweb = odoo_env["ir.qweb"]
+    qweb._get_asset_bundle.return_value.js.side_effect = [None, None, Exception]
+    env.prewarm_assets("odoo", jobs=2)
+
+    calls = {
+        (call.args[0], call.kwargs["rtl"])
+        for call in qweb._get_asset_bundle.call_args_list
+    }
+    assert calls == {
+        ("web.assets_web", True),
+        ("web.assets_frontend", True),
+    }
+
+    env.set(base.SECTION, "prewarm_bundles", value=["web.assets_backend"])
+    env.prewarm_assets("odoo")
+    assert qweb._get_asset_bundle.call_args.args[0] == "web.assets_backend"
+
+
+def test_plan(env):
+    manifests = ManifestIndex("missing.json")
+    manifests.modules = {
+        name: {"depends": depends, "auto_install": auto, "installable": True}
+        for name, depends, auto in [
+            ("base", [], False),
+            ("normal", ["base"], False),
+            ("dependent", ["normal"], False),
+            ("new", ["extra"], False),
+            ("extra", ["base"], False),
+            ("bridge", ["new", "normal"], True),
+            ("other", ["missing"], True),
+        ]
+    }
+    for info in manifests.modules.values():
+        info["version"] = "1.0"
+    manifests.modules["normal"]["version"] = "1.1"
+
+    env._manifests = mock.MagicMock(return_value=manifests)
+    env._get_modules = mock.MagicMock(return_value={"new"})
+    env._migration_path = mock.MagicMock(side_effect=lambda name: f"{name}.py")
+    env._connect = mock.MagicMock()
+    env.set("odoo", "options", "db_name", value="odoo")
+    cr = env._connect.return_value.__enter__.return_value
+    cr.fetchall.return_value = [
+        ("base", "installed", "17.0.1.0"),
+        ("normal", "installed", "17.0.1.0"),
+        ("dependent", "installed", "17.0.1.0"),
+        ("uninstalled", "uninstalled", None),
+    ]
+
+    args, _ = load_update_arguments([])
+    assert env.plan(args).splitlines() == [
+        "Database: odoo (update)",
+        "Install (2): extra, new",
+        "Upgrade [version] (2): dependent, normal",
+        "Auto install candidates (1): bridge",
+        "Scripts (3): post_update.py, pre_install.py, pre_update.py",
+    ]
+
+    args, _ = load_update_arguments(["--all"])
+    assert "Upgrade [all] (3): base, dependent, normal" in env.plan(args)
+
+    args, _ = load_update_arguments(["dependent"])
+    assert "Upgrade [specific] (1): dependent" in env.plan(args)
+
+    env._connect.side_effect = Exception()
+    args, _ = load_update_arguments([])
+    plan = env.plan(args).splitlines()
+    assert plan[:2] == ["Database: odoo (initialize)", "Install (3): base, extra, new"]
+
+
+@mock.patch("doblib.module.ModuleEnvironment.plan", return_value="plan")
+def test_update_plan(plan, env, capsys):
+    env.generate_config = mock.MagicMock()
+    assert env.update(["--plan"]) is None
+    env.generate_config.assert_not_called()
+    assert capsys.readouterr().out == "plan\n"
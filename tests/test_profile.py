@@ -0,0 +1,75 @@
+# © 2026 initOS GmbH
+# License Apache-2.0 (http://www.apache.org/licenses/).
+
+import sys
+import types
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from doblib.profile import ModuleProfiler
+
+
+def fake_loading():
+    """Fake the loading module of Odoo"""
+    loading = types.ModuleType("odoo.modules.loading")
+    package = mock.MagicMock()
+    package.name = "sale"
+
+    def load_openerp_module(name):
+        return name
+
+    def load_data(env, idref, mode, kind, package):
+        # Python loading nested in the data loading
+        loading.load_openerp_module("nested")
+        return kind
+
+    loading.load_openerp_module = load_openerp_module
+    loading.load_data = load_data
+    return loading, package
+
+
+def test_profiler():
+    loading, package = fake_loading()
+    original = loading.load_data
+    with mock.patch.dict(sys.modules, {"odoo.modules.loading": loading}):
+        with ModuleProfiler() as profiler:
+            assert loading.load_data is not original
+            assert loading.load_openerp_module("base") == "base"
+            assert loading.load_data(None, {}, "init", "data", package) == "data"
+
+        assert loading.load_data is original
+
+    assert set(profiler.timings) == {"base", "sale", "nested"}
+    assert profiler.timings["sale"]["data"] >= 0
+    assert profiler.timings["nested"]["python"] > 0
+    assert profiler.timings["sale"]["schema"] == 0
+
+    report = profiler.report().splitlines()
+    assert report[0].split() == [
+        "module",
+        "python",
+        "data",
+        "translations",
+        "schema",
+        "total",
+    ]
+    assert len(report) == 4
+
+    for line in profiler.folded().splitlines():
+        stack, value = line.split()
+        assert stack.startswith("update;")
+        assert int(value) > 0
+
+    with TemporaryDirectory() as dir_name:
+        profiler.write(f"{dir_name}/profile")
+        with open(f"{dir_name}/profile.txt", encoding="utf-8") as fp:
+            assert fp.read().startswith("module")
+        with open(f"{dir_name}/profile.folded", encoding="utf-8") as fp:
+            assert "update;" in fp.read()
+
+
+def test_unknown_module():
+    profiler = ModuleProfiler()
+    wrapped = profiler._wrap(lambda: 42, "schema", lambda: 1 / 0)
+    assert wrapped() == 42
+    assert set(profiler.timings) == {"?"}
@@ -1,15 +1,22 @@
 # © 2021 Florian Kantelberg (initOS GmbH)
 # License Apache-2.0 (http://www.apache.org/licenses/).
 
+import io
+import json
 import os
 import sys
-from tempfile import NamedTemporaryFile
+from tempfile import NamedTemporaryFile, TemporaryDirectory
 from unittest import mock
 
 import pytest
 
 from doblib import base
-from doblib.run import RunEnvironment
+from doblib.run import (
+    RunEnvironment,
+    batch_console,
+    load_batch_scripts,
+    load_shell_arguments,
+)
 
 DEBUGGERS = ["debugpy"]
 
@@ -77,3 +84,107 @@ def test_start_with_debugger(call_mock, env):
     env.set(base.SECTION, "debugger", value="dev")
     assert env.start() == 128
     call_mock.assert_called_once()
+
+
+def test_shell_arguments():
+    args, left = load_shell_arguments(["a.py", "b.py", "arg", "c.py"])
+    assert args.files == ["a.py", "b.py"]
+    assert left == ["arg", "c.py"]
+
+    args, left = load_shell_arguments(["script", "arg"])
+    assert args.files == ["script"]
+    assert left == ["arg"]
+
+
+def test_batch_console():
+    scripts = [
+        {"name": "a", "code": "env.value = 1", "transaction": False},
+        {"name": "b", "code": "raise ValueError()", "transaction": True},
+        {"name": "c", "code": "import sys; sys.exit(3)", "transaction": False},
+        {"name": "d", "code": "assert __name__ == '__main__'", "transaction": True},
+    ]
+    results, reported = {}, []
+    env = mock.MagicMock()
+    console = batch_console(scripts, results, lambda *r: reported.append(r[:2]))
+    console({"env": env})
+
+    assert env.value == 1
+    assert {name: code for name, (code, _) in results.items()} == {
+        "a": 0,
+        "b": 1,
+        "c": 3,
+        "d": 0,
+    }
+    assert reported == [("a", 0), ("b", 1), ("c", 3), ("d", 0)]
+    assert env.cr.savepoint.call_count == 2
+    env.cr.rollback.assert_called_once()
+    env.cr.commit.assert_called_once()
+
+
+def test_batch_console_commit():
+    args, _ = load_shell_arguments(["a.py", "b.py"])
+    scripts = [
+        {"name": "a", "code": "env.cr.commit()", "transaction": args.transaction},
+        {"name": "b", "code": "pass", "transaction": args.transaction},
+    ]
+    results = {}
+    env = mock.MagicMock()
+    batch_console(scripts, results)({"env": env})
+
+    # Scripts commit themselves in their own transaction by default
+    assert {name: code for name, (code, _) in results.items()} == {"a": 0, "b": 0}
+    env.cr.savepoint.assert_not_called()
+    assert env.cr.commit.call_count == 3
+
+    # The savepoint is gone after a commit in the script
+    env.reset_mock()
+    env.cr.savepoint.return_value.__exit__.side_effect = [Exception(), None]
+    for script in scripts:
+        script["transaction"] = False
+    batch_console(scripts, results)({"env": env})
+
+    assert {name: code for name, (code, _) in results.items()} == {"a": 1, "b": 0}
+    env.cr.rollback.assert_called_once()
+
+
+def test_shell_batch(env, capsys):
+    shell = sys.modules["odoo.cli.shell"] = mock.MagicMock()
+    env._init_odoo = mock.MagicMock(return_value=True)
+
+    def run(args):
+        shell.Shell.return_value.console({"env": mock.MagicMock()})
+
+    shell.Shell.return_value.run.side_effect = run
+    with TemporaryDirectory() as dir_name:
+        for name, code in [("a.py", "pass"), ("b.py", "1 / 0")]:
+            with open(f"{dir_name}/{name}", "w+", encoding="utf-8") as fp:
+                fp.write(code)
+
+        assert env.shell([f"{dir_name}/a.py", f"{dir_name}/a.py"]) == 0
+        assert env.shell([f"{dir_name}/a.py", f"{dir_name}/b.py"]) == 1
+        assert "failed (1)" in capsys.readouterr().out
+
+        stdin = io.StringIO(
+            json.dumps({"script": f"{dir_name}/a.py"})
+            + "\n\n"
+            + json.dumps({"code": "x = 1", "transaction": True})
+            + "\n"
+        )
+        with mock.patch("sys.stdin", stdin):
+            assert env.shell(["--stdin-jsonl"]) == 0
+
+    lines = [json.loads(x) for x in capsys.readouterr().out.splitlines()]
+    assert [(x["name"], x["exit"]) for x in lines] == [
+        (f"{dir_name}/a.py", 0),
+        ("<stdin:3>", 0),
+    ]
+
+
+def test_load_batch_scripts():
+    args, _ = load_shell_arguments(["--stdin-jsonl"])
+    stdin = [json.dumps({"code": "pass", "transaction": False}), json.dumps({})]
+    with pytest.raises(ValueError):
+        load_batch_scripts(args, stdin)
+
+    scripts = load_batch_scripts(args, stdin[:1] + [json.dumps({"code": "x"})])
+    assert [script["transaction"] for script in scripts] == [False, True]
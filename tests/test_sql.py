@@ -0,0 +1,88 @@
+# © 2026 initOS GmbH
+# License Apache-2.0 (http://www.apache.org/licenses/).
+
+import io
+from unittest import mock
+
+from doblib.sql import COMMIT, execute_script, split_statements
+
+SCRIPT = """-- Leading comment; with semicolon
+SELECT 1;
+SELECT 'a;b', "c;d" FROM x; SELECT 'it''s;';
+/* block; /* nested; */ comment */
+CREATE FUNCTION f() RETURNS int AS $body$
+BEGIN
+    RETURN 1; -- inner
+END;
+$body$ LANGUAGE plpgsql;
+SELECT E'back\\'slash;', $$dollar;$$, $1;
+COPY res_partner (name) FROM STDIN;
+a;b
+c
+\\.
+-- dob: commit
+UPDATE x SET a = 1
+"""
+
+
+def statements(script):
+    return [stmt for stmt, _ in split_statements(io.StringIO(script))]
+
+
+def test_split_statements():
+    result = statements(SCRIPT)
+    assert result[0] == "SELECT 1;"
+    assert result[1] == "SELECT 'a;b', \"c;d\" FROM x;"
+    assert result[2] == "SELECT 'it''s;';"
+    assert result[3].startswith("CREATE FUNCTION f()")
+    assert result[3].endswith("$body$ LANGUAGE plpgsql;")
+    assert "RETURN 1; -- inner" in result[3]
+    assert result[4] == "SELECT E'back\\'slash;', $$dollar;$$, $1;"
+    assert result[5] == "COPY res_partner (name) FROM STDIN;"
+    assert result[6] is COMMIT
+    assert result[7] == "UPDATE x SET a = 1"
+    assert len(result) == 8
+
+
+def test_copy_data():
+    copies = [
+        (stmt, data.read())
+        for stmt, data in split_statements(io.StringIO(SCRIPT))
+        if data is not None
+    ]
+    assert copies == [("COPY res_partner (name) FROM STDIN;", "a;b\n")]
+
+    # Unconsumed data is skipped
+    result = statements("COPY x FROM stdin;\n1\n2\n\\.\nSELECT 2;")
+    assert result == ["COPY x FROM stdin;", "SELECT 2;"]
+
+
+def test_empty_statements():
+    assert statements("") == []
+    assert statements(";\n  ;\n-- only a comment\n/* and a block */") == []
+    assert statements("SELECT 1") == ["SELECT 1"]
+
+
+def test_execute_script():
+    cr = mock.MagicMock()
+    with mock.patch("doblib.sql.time.perf_counter", side_effect=range(100)):
+        assert execute_script(cr, io.StringIO(SCRIPT), slow=10) == 7
+
+    assert cr.execute.call_count == 6
+    cr.execute.assert_any_call("SELECT 1;")
+    cr.copy_expert.assert_called_once()
+    assert cr.copy_expert.call_args[0][0] == "COPY res_partner (name) FROM STDIN;"
+    # The statements after the last commit marker are committed too
+    assert cr.commit.call_count == 2
+    assert cr.mock_calls[-1] == mock.call.commit()
+
+
+def test_execute_script_commit():
+    # Scripts without commit markers are left to the caller
+    cr = mock.MagicMock()
+    execute_script(cr, io.StringIO("SELECT 1;\nSELECT 2;"))
+    cr.commit.assert_not_called()
+
+    # Nothing left after the last marker
+    execute_script(cr, io.StringIO("SELECT 1;\n-- dob: commit\n"))
+    cr.commit.assert_called_once()
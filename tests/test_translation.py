@@ -0,0 +1,75 @@
+# © 2026 initOS GmbH
+# License Apache-2.0 (http://www.apache.org/licenses/).
+
+import sys
+import types
+from unittest import mock
+
+from doblib.translation import LANGUAGES, TranslationCache
+
+
+class FakeRecords(list):
+    def mapped(self, field):
+        return [rec.name for rec in self]
+
+    def filtered(self, func):
+        return FakeRecords(filter(func, self))
+
+
+def fake_ir_module(calls):
+    """Fake the ir_module module of Odoo"""
+    ir_module = types.ModuleType("odoo.addons.base.models.ir_module")
+
+    class Module:
+        def _load_module_terms(self, modules, langs, overwrite=False):
+            calls.append(sorted(modules))
+
+        def _update_translations(self, filter_lang=None, overwrite=False):
+            calls.append(sorted(self.mapped("name")))
+
+    ir_module.Module = Module
+    return ir_module
+
+
+def test_translation_cache():
+    cr = mock.MagicMock()
+    cr.fetchall.return_value = [("sale", "a"), ("stock", "b"), (LANGUAGES, "de_DE")]
+    cache = TranslationCache({"sale": "a", "stock": "c"}, ["de_DE"]).read(cr)
+    assert cache.active
+    assert not cache.changed("sale")
+    assert cache.changed("stock")
+    assert cache.changed("unknown")
+
+    calls = []
+    ir_module = fake_ir_module(calls)
+    original = ir_module.Module._load_module_terms
+    name = "odoo.addons.base.models.ir_module"
+    with mock.patch.dict(sys.modules, {name: ir_module}):
+        with cache:
+            assert ir_module.Module._load_module_terms is not original
+            model = ir_module.Module()
+            model._load_module_terms(["sale", "stock"], ["de_DE"], overwrite=True)
+            model._load_module_terms(["sale"], ["de_DE"], overwrite=True)
+
+            records = FakeRecords([mock.MagicMock(), mock.MagicMock()])
+            records[0].name, records[1].name = "sale", "stock"
+            ir_module.Module._update_translations(records)
+
+        assert ir_module.Module._load_module_terms is original
+
+    assert calls == [["stock"], ["stock"]]
+    assert cache.loaded == {"stock"}
+    assert cache.skipped == {"sale"}
+
+    cr.reset_mock()
+    cache.store(cr)
+    args = [call.args[1] for call in cr.execute.call_args_list]
+    assert args == [("stock", "c"), (LANGUAGES, "de_DE")]
+
+
+def test_translation_cache_languages():
+    cr = mock.MagicMock()
+    cr.fetchall.return_value = [("sale", "a"), (LANGUAGES, "de_DE")]
+    cache = TranslationCache({"sale": "a"}, ["de_DE", "fr_FR"]).read(cr)
+    assert not cache.active
+    assert cache.changed("sale")
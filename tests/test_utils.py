@@ -2,6 +2,11 @@
 # License Apache-2.0 (http://www.apache.org/licenses/).
 
 import argparse
+import os
+import sys
+import time
+from fnmatch import fnmatch
+from tempfile import TemporaryDirectory
 from unittest.mock import patch
 
 import pytest
@@ -57,6 +62,51 @@ def test_check_filters():
     assert utils.check_filters("abcd", whitelist=["abc*"], blacklist=["ab*"])
     assert utils.check_filters("aac", whitelist=["a*"], blacklist=["ab*"])
     assert utils.check_filters("bac", whitelist=["a*"], blacklist=["ab*"])
+    assert utils.check_filters("abc", whitelist=["abc"], blacklist=["ab*"])
+    assert not utils.check_filters("abc", whitelist=["a?c"], blacklist=["abc"])
+
+
+def reference_filters(name, whitelist, blacklist):
+    """Straight forward implementation of the filter semantic"""
+
+    def matches(patterns):
+        return [len(pat.replace("*", "")) for pat in patterns if fnmatch(name, pat)]
+
+    if not whitelist and not blacklist:
+        return True
+
+    whitelist_matches, blacklist_matches = matches(whitelist), matches(blacklist)
+    if whitelist_matches and blacklist_matches:
+        return max(whitelist_matches) > max(blacklist_matches)
+    return not blacklist_matches
+
+
+def test_filter_matcher_reference():
+    prefixes = ["account", "sale", "stock", "web", "l10n_de", "hr", "mrp"]
+    names = [f"{p}_{i}" for p in prefixes for i in range(430)]
+    whitelist = ["*", "account_*", "sale_1*", "stock_12", "l10n_*", "web_?"]
+    blacklist = ["l10n_de*", "sale_*", "mrp_*", "hr_1[0-5]*", "stock_1*", "web_1"]
+
+    def reference():
+        return [reference_filters(n, whitelist, blacklist) for n in names]
+
+    def compiled():
+        matcher = utils.FilterMatcher(whitelist, blacklist)
+        return [matcher(n) for n in names]
+
+    def best(func):
+        timings = []
+        for _ in range(3):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    result = compiled()
+    assert result == reference()
+    assert any(result) and not all(result)
+    # The compiled matcher must not be slower than matching with fnmatch
+    assert best(compiled) <= best(reference)
 
 
 @patch("os.path.isfile")
@@ -79,3 +129,90 @@ def test_call():
 
     output = utils.call("ls", pipe=False)
     assert output == 0
+
+
+def test_json():
+    with TemporaryDirectory() as dir_name:
+        path = f"{dir_name}/sub/file.json"
+        assert utils.read_json(path, 42) == 42
+
+        utils.write_json(path, {"a": [1, 2]})
+        assert utils.read_json(path) == {"a": [1, 2]}
+        assert os.listdir(f"{dir_name}/sub") == ["file.json"]
+
+
+def test_file_lock():
+    with TemporaryDirectory() as dir_name:
+        with utils.file_lock(f"{dir_name}/sub/file.json"):
+            assert os.path.isfile(f"{dir_name}/sub/file.json.lock")
+
+
+def test_run_parallel(capsys):
+    commands = {
+        "ok": ([sys.executable, "-c", "print('done')"], None),
+        "fail": ([sys.executable, "-c", "raise SystemExit(3)"], None),
+    }
+    commands["missing"] = ([sys.executable], None, "/missing/directory")
+    results = utils.run_parallel(commands, 2)
+    assert results["ok"][0] == 0
+    assert results["fail"][0] == 3
+    assert results["missing"][0] == 1
+    out = capsys.readouterr().out
+    assert "[ok] done" in out
+    assert "[missing]" in out
+
+    table = utils.summary(results).splitlines()
+    assert table[0].split() == ["name", "status", "duration"]
+    assert table[1].startswith("fail     failed (3)")
+    assert table[3].startswith("ok       ok")
+
+
+def test_run_parallel_logs():
+    with TemporaryDirectory() as dir_name:
+        cmd = [sys.executable, "-c", "import os; print(os.getcwd())"]
+        results = utils.run_parallel(
+            {"a/b": (cmd, None, dir_name)}, log_dir=f"{dir_name}/logs"
+        )
+        assert results["a/b"][0] == 0
+
+        with open(f"{dir_name}/logs/a_b.log", encoding="utf-8") as fp:
+            assert fp.read().strip() == os.path.realpath(dir_name)
+
+
+def test_resolve():
+    obj, name, func = utils.resolve("doblib.utils", "Version.__str__")
+    assert obj is utils.Version
+    assert name == "__str__"
+    assert func is utils.Version.__str__
+    assert utils.resolve("doblib.utils", "missing") is None
+    assert utils.resolve("doblib.missing", "missing") is None
+
+
+def test_available_resources():
+    with TemporaryDirectory() as dir_name:
+        cpus = utils.available_cpus(dir_name)
+        assert cpus >= 1
+        memory = utils.available_memory(dir_name)
+
+        with open(f"{dir_name}/cpu.max", "w+", encoding="utf-8") as fp:
+            fp.write("max 100000\n")
+        assert utils.available_cpus(dir_name) == cpus
+
+        with open(f"{dir_name}/cpu.max", "w+", encoding="utf-8") as fp:
+            fp.write("50000 100000\n")
+        assert utils.available_cpus(dir_name) == 1
+
+        with open(f"{dir_name}/memory.max", "w+", encoding="utf-8") as fp:
+            fp.write("max\n")
+        assert utils.available_memory(dir_name) == memory
+
+        with open(f"{dir_name}/memory.max", "w+", encoding="utf-8") as fp:
+            fp.write(f"{1 << 30}\n")
+        assert utils.available_memory(dir_name) == 1 << 30
+
+        # Unlimited cgroup v1
+        os.remove(f"{dir_name}/memory.max")
+        os.makedirs(f"{dir_name}/memory")
+        with open(f"{dir_name}/memory/memory.limit_in_bytes", "w+") as fp:
+            fp.write(f"{1 << 62}\n")
+        assert utils.available_memory(dir_name) == memory